@@ -1,17 +1,51 @@
+import gzip
+import mimetypes
 import os
+import re
+import secrets
+import sqlite3
+import sys
+import threading
+import time
 from datetime import datetime
 from flask import (
-    Flask, render_template, redirect,
-    url_for, session, flash, request
+    Flask, render_template, redirect, send_from_directory,
+    url_for, session, flash, request, jsonify, g, Response, abort,
+    has_request_context, before_render_template, template_rendered
 )
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from db import get_connection, init_db, seed_sample_games
-from gamestore_lib import  calculate_cart_total, cart_item_count, format_eur, upload_game_image, send_order_event_to_sqs, notify_order_via_sns
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
+import db
+from db import get_connection, init_db, rebuild_search_index, find_plan_problems
+from db import get_catalog_version, catalog_write
+from db import run_write, place_order, StaleCartError, insert_game, update_game, delete_game, insert_user
+from db import claim_outbox_events, mark_outbox_delivered, reschedule_outbox_events
+from db import purge_delivered_outbox
+from db import claim_image_uploads, complete_image_upload, reschedule_image_uploads
+from db import load_cart_items, cart_add_item, cart_set_quantity, cart_remove_items, cart_change_once
+from db import merge_carts, expire_carts, apply_order_events
+from gamestore_lib import  calculate_cart_total, cart_item_count, format_eur
+from gamestore_lib import LocalImageStore, S3ImageStore, image_extension, is_image_key
+from gamestore_lib import IMAGE_CACHE_CONTROL, ImageUploadPool
+from gamestore_lib import cart_lines
+from gamestore_lib import build_order_event, build_order_notification, OutboxDispatcher
+from gamestore_lib import create_transport, EventConsumer, order_event_updates
+from gamestore_lib import encode_cursor, decode_cursor, is_sqlite_int
+from gamestore_lib import build_fts_query, highlight_markup, HIGHLIGHT_START, HIGHLIGHT_END
+from gamestore_lib import TitleIndex, LRUCache, GameRecord, GameCache, CatalogVersion
+from gamestore_lib import ResponseCache
+from gamestore_lib import make_etag, parse_sqlite_timestamp
+from gamestore_lib import AssetManifest
+from gamestore_lib import metrics
+from gamestore_lib import SQLTracer, assert_max_queries
+from gamestore_lib import is_compressible, gzip_sibling, precompress_files
 
 app = Flask(__name__)
 app.secret_key = "change_this_secret_key"  # change for production
 
+# Request-scoped SQLite connection (closed on app context teardown)
+db.init_app(app)
+
 #  File upload configuration 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "static", "uploads")
@@ -19,37 +53,738 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
 
-# DB INIT 
-with app.app_context():
-    init_db()
-    # seed_sample_games is currently a no-op in your updated db.py
-    seed_sample_games()
+# Game images are stored by content hash, in S3 when a bucket is configured
+# and in IMAGE_FOLDER (served from /images/<hash>.<ext>) otherwise.
+IMAGE_FOLDER = os.environ.get("IMAGE_FOLDER") or UPLOAD_FOLDER
+IMAGE_STORE = os.environ.get("IMAGE_STORE") or (
+    "s3" if os.environ.get("S3_BUCKET_NAME") else "local"
+)
+if IMAGE_STORE == "s3":
+    image_store = S3ImageStore(public_url=os.environ.get("IMAGE_PUBLIC_URL"))
+else:
+    image_store = LocalImageStore(IMAGE_FOLDER, url_prefix="/images")
+
+# With S3, uploads are spooled to IMAGE_SPOOL_FOLDER (private, under the
+# instance folder) and the game is saved at once with a pending image; a
+# bounded pool per worker moves the file to S3 and then points the game at
+# it. Set IMAGE_UPLOADS_ASYNC=0 to upload inline.
+IMAGE_UPLOADS_ASYNC = (
+    IMAGE_STORE == "s3" and os.environ.get("IMAGE_UPLOADS_ASYNC", "1") != "0"
+)
+IMAGE_UPLOAD_WORKERS = int(os.environ.get("IMAGE_UPLOAD_WORKERS", 4))
+IMAGE_UPLOAD_POLL_INTERVAL = float(os.environ.get("IMAGE_UPLOAD_POLL_INTERVAL", 10.0))
+IMAGE_UPLOAD_LEASE_SECONDS = float(os.environ.get("IMAGE_UPLOAD_LEASE_SECONDS", 300.0))
+IMAGE_UPLOAD_MAX_ATTEMPTS = int(os.environ.get("IMAGE_UPLOAD_MAX_ATTEMPTS", 8))
+IMAGE_SPOOL_FOLDER = os.environ.get("IMAGE_SPOOL_FOLDER") or os.path.join(
+    app.instance_path, "image-spool"
+)
+image_spool = LocalImageStore(IMAGE_SPOOL_FOLDER, url_prefix="/images")
 
-# HELPERS 
-def get_cart():
-    return session.get("cart", {})
+#  Storefront catalog configuration 
+CATALOG_PAGE_SIZE = 24
 
+# sort key -> (column, direction); every sort also orders by id as tie-breaker
+CATALOG_SORTS = {
+    "newest": ("id", "DESC"),
+    "price_asc": ("price", "ASC"),
+    "price_desc": ("price", "DESC"),
+    "title": ("title", "ASC"),
+}
 
-def save_cart(cart):
-    session["cart"] = cart
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50
 
+ORDERS_PAGE_SIZE = 10
+
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+
+# Logged-in user identity / role cache (per worker process)
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+
+# Catalog caches (per worker process); other workers' writes are picked up
+# within CATALOG_VERSION_CHECK_INTERVAL seconds via the catalog version counter
+CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get("CATALOG_VERSION_CHECK_INTERVAL", 1.0))
+GAME_CACHE_SIZE = int(os.environ.get("GAME_CACHE_SIZE", 4096))
+
+# Full-page cache for anonymous visitors with an empty cart
+RESPONSE_CACHE_ENDPOINTS = {"index", "game_detail", "about"}
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Conditional GET (ETag / Last-Modified / 304) for catalog and game pages.
+# RELEASE_ID is part of every ETag so a deploy with new templates never
+# answers 304 for a page that now renders differently.
+CONDITIONAL_ENDPOINTS = {"index", "game_detail"}
+
+
+def default_release_id():
+    """Newest modification time of app.py, the templates and the stylesheets."""
+    paths = [os.path.join(BASE_DIR, "app.py")]
+    for folder in ("templates", os.path.join("static", "css"), os.path.join("static", "js")):
+        for root, _, names in os.walk(os.path.join(BASE_DIR, folder)):
+            paths.extend(os.path.join(root, name) for name in names)
+    return str(int(max(os.path.getmtime(path) for path in paths)))
+
+
+RELEASE_ID = os.environ.get("RELEASE_ID") or default_release_id()
+
+#  Templates and static assets 
+# Compiled templates are kept on disk so freshly started workers skip
+# compiling them; Jinja re-checks each template's mtime before reuse. The
+# cache is loaded as code, so it lives in the app's private instance folder
+# rather than a shared, predictable temp directory.
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR") or os.path.join(
+    app.instance_path, "jinja-cache"
+)
+os.makedirs(JINJA_CACHE_DIR, mode=0o700, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+# Stylesheets are linked as /assets/<content hash>/<path> and cached for a year
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+asset_manifest = AssetManifest(
+    app.static_folder,
+    auto_reload=os.environ.get("ASSET_AUTO_RELOAD") == "1",
+)
+app.jinja_env.globals["asset_url"] = asset_manifest.asset_url
+
+#  Response compression 
+# Dynamic text responses between the two thresholds are gzipped per request;
+# static text assets are gzipped once at build time by `flask compress-assets`
+# and served from their .gz siblings. Only the asset folders are compressed,
+# never seller uploads. PRECOMPRESS_STATIC=1 also does it at startup, for
+# deployments without a build step (failures are logged, not fatal).
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 500))
+COMPRESS_MAX_BYTES = int(os.environ.get("COMPRESS_MAX_BYTES", 4 * 1024 * 1024))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+PRECOMPRESS_FOLDERS = ("css", "js")
+PRECOMPRESS_STATIC = os.environ.get("PRECOMPRESS_STATIC") == "1"
+
+
+def precompress_static_assets() -> int:
+    """Write .gz siblings for the text assets in PRECOMPRESS_FOLDERS."""
+    return sum(
+        precompress_files(os.path.join(app.static_folder, folder))
+        for folder in PRECOMPRESS_FOLDERS
+    )
 
-def get_current_user():
-    user_id = session.get("user_id")
-    if not user_id:
-        return None
 
+if PRECOMPRESS_STATIC:
+    try:
+        precompress_static_assets()
+    except OSError as e:
+        print("Static asset precompression skipped:", e)
+
+#  Order event outbox 
+# Checkout only writes outbox rows; a background thread per worker delivers
+# them to SQS / SNS. Set OUTBOX_DISPATCHER=0 to run without one (e.g. when a
+# separate process drains the outbox).
+OUTBOX_DISPATCHER_ENABLED = os.environ.get("OUTBOX_DISPATCHER", "1") != "0"
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 5.0))
+OUTBOX_LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", 60.0))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 12))
+# Delivered events are kept this long (for debugging) and then purged by the
+# dispatcher every OUTBOX_PURGE_INTERVAL seconds
+OUTBOX_RETENTION_SECONDS = float(os.environ.get("OUTBOX_RETENTION_SECONDS", 7 * 24 * 60 * 60))
+OUTBOX_PURGE_INTERVAL = float(os.environ.get("OUTBOX_PURGE_INTERVAL", 3600))
+
+# Where the dispatcher delivers order events: "aws" (SQS / SNS), "local" (a
+# durable SQLite queue file, drained by ORDER_EVENT_CONSUMER or read_sqs.py)
+# or "inprocess" (memory only, for dev and load tests). Defaults to SQS when
+# a queue is configured and to the local queue otherwise.
+ORDER_EVENT_TRANSPORT = os.environ.get("ORDER_EVENT_TRANSPORT") or (
+    "aws" if os.environ.get("SQS_QUEUE_URL") else "local"
+)
+ORDER_EVENT_QUEUE_PATH = os.environ.get("ORDER_EVENT_QUEUE_PATH") or os.path.join(
+    os.path.dirname(db.DB_NAME), "order_events.db"
+)
+# Local queue messages nobody consumed are dropped after this long (SQS
+# queues have their own retention period)
+ORDER_EVENT_RETENTION_SECONDS = float(
+    os.environ.get("ORDER_EVENT_RETENTION_SECONDS", 4 * 24 * 60 * 60)
+)
+# Consume order events in a thread of each worker. On by default for the
+# local and inprocess transports, which nothing else drains unless
+# read_sqs.py runs; SQS queues are consumed by read_sqs.py.
+ORDER_EVENT_CONSUMER_ENABLED = os.environ.get(
+    "ORDER_EVENT_CONSUMER", "0" if ORDER_EVENT_TRANSPORT == "aws" else "1"
+) != "0"
+order_transport = create_transport(
+    ORDER_EVENT_TRANSPORT, ORDER_EVENT_QUEUE_PATH, ORDER_EVENT_RETENTION_SECONDS
+)
+
+#  Server-side carts 
+# The cart lives in the carts / cart_items tables; the browser only keeps an
+# opaque cart id cookie (anonymous visitors) or nothing (logged-in users).
+CART_COOKIE_NAME = "cart_id"
+# Anonymous cart ids are secrets.token_urlsafe(CART_ID_BYTES) values. Other
+# cookie values are ignored, so a visitor cannot name someone else's cart:
+# user carts ("user:<id>") can never match.
+CART_ID_BYTES = 18
+VISITOR_CART_ID_RE = re.compile(r"[A-Za-z0-9_-]{24}")
+CART_TTL_SECONDS = int(os.environ.get("CART_TTL_SECONDS", 30 * 24 * 60 * 60))
+CART_EXPIRY_INTERVAL = float(os.environ.get("CART_EXPIRY_INTERVAL", 3600))
+# Optional per-process cache of cart contents. A cart changed by another
+# worker is only seen once the entry expires, so keep it off (0) unless the
+# app runs as a single process or behind sticky sessions.
+CART_CACHE_SIZE = int(os.environ.get("CART_CACHE_SIZE", 0))
+CART_CACHE_TTL_SECONDS = float(os.environ.get("CART_CACHE_TTL_SECONDS", 30))
+MAX_CART_QUANTITY = 99
+
+#  Metrics 
+# Per-endpoint latency, SQLite time and template render time, served at
+# /metrics in Prometheus text format. Each worker keeps its own totals; with
+# METRICS_DIR set (e.g. under gunicorn), workers also write them there every
+# METRICS_FLUSH_INTERVAL seconds and /metrics merges every worker's file.
+METRICS_ENABLED = os.environ.get("METRICS", "1") != "0"
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5.0))
+if METRICS_DIR:
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+REQUEST_SECONDS = "gamestore_http_request_duration_seconds"
+REQUEST_DB_QUERIES = "gamestore_http_request_db_queries"
+DB_QUERIES_TOTAL = "gamestore_db_queries_total"
+DB_QUERY_SECONDS_TOTAL = "gamestore_db_query_seconds_total"
+TEMPLATE_RENDER_SECONDS = "gamestore_template_render_seconds"
+
+metrics.histogram(REQUEST_SECONDS, "Request latency by endpoint, method and status.")
+metrics.histogram(
+    REQUEST_DB_QUERIES, "SQLite statements run per request, by endpoint.",
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+metrics.counter(
+    DB_QUERIES_TOTAL,
+    "SQLite statements by endpoint (background: writer and worker threads).",
+)
+metrics.counter(DB_QUERY_SECONDS_TOTAL, "Time spent in SQLite statements by endpoint.")
+metrics.histogram(TEMPLATE_RENDER_SECONDS, "Template render time by template.")
+
+#  SQL tracing 
+# Off by default. With SQL_TRACE=1 every statement is recorded per request
+# (shape, time, rows, SQLite VM steps): statements slower than SQL_SLOW_QUERY_MS
+# are logged with their query plan, requests running one statement shape more
+# than SQL_REPEAT_THRESHOLD times are logged as likely N+1 loops, and responses
+# carry a Server-Timing header. SQL_TRACE_VERBOSE=1 also logs every request's
+# statements.
+SQL_TRACE_ENABLED = os.environ.get("SQL_TRACE") == "1"
+SQL_TRACE_VERBOSE = os.environ.get("SQL_TRACE_VERBOSE") == "1"
+SQL_SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_QUERY_MS", 50))
+SQL_REPEAT_THRESHOLD = int(os.environ.get("SQL_REPEAT_THRESHOLD", 10))
+
+# Most statements an anonymous GET of each route may run on a cold cache;
+# checked by `flask check-query-counts`.
+ROUTE_QUERY_BUDGETS = {
+    "/": 4,
+    "/?sort=price_asc": 4,
+    "/search?q=game": 3,
+    "/api/suggest?q=ga": 3,
+    "/game/{game_id}": 3,
+    "/about": 1,
+    "/cart": 2,
+    "/api/cart": 2,
+}
+
+#  Hot queries 
+# Kept here so `flask check-query-plans` can EXPLAIN exactly what the views run.
+USER_BY_ID_SQL = "SELECT id, email, user_type, is_admin FROM users WHERE id = ?"
+USER_BY_EMAIL_SQL = "SELECT * FROM users WHERE email = ?"
+SELLER_GAME_SQL = "SELECT * FROM games WHERE id = ? AND seller_id = ?"
+SELLER_GAMES_SQL = """
+    SELECT g.*, u.status AS image_upload_status
+    FROM games g
+    LEFT JOIN image_uploads u ON u.game_id = g.id
+    WHERE g.seller_id = ?
+    ORDER BY g.id DESC
+"""
+CATALOG_META_SQL = "SELECT version, updated_at FROM catalog_meta WHERE id = 1"
+GAME_UPDATED_AT_SQL = "SELECT updated_at FROM games WHERE id = ?"
+
+
+def games_by_ids_sql(count: int) -> str:
+    placeholders = ",".join("?" for _ in range(count))
+    return (
+        "SELECT id, title, description, price, image_url, seller_id "
+        f"FROM games WHERE id IN ({placeholders})"
+    )
+
+
+def order_history_sql(backwards: bool, with_cursor: bool) -> str:
+    """
+    One page of a buyer's orders plus their items in a single statement.
+
+    The CTE seeks the page in idx_orders_user_created_id ((created_at, id)
+    keyset, newest first), so only the visible orders and their items are
+    ever read. Params: user_id, [cursor created_at, cursor id], limit.
+    """
+    direction = "ASC" if backwards else "DESC"
+    cursor = ""
+    if with_cursor:
+        cursor = f"AND (created_at, id) {'>' if backwards else '<'} (?, ?)"
+    return f"""
+        WITH page AS (
+            SELECT id, total_amount, created_at, status
+            FROM orders
+            WHERE user_id = ? {cursor}
+            ORDER BY created_at {direction}, id {direction}
+            LIMIT ?
+        )
+        SELECT page.id, page.total_amount, page.created_at, page.status,
+               oi.quantity, oi.price_each,
+               COALESCE(g.title, '(no longer listed)') AS game_title
+        FROM page
+        LEFT JOIN order_items oi ON oi.order_id = page.id
+        LEFT JOIN games g ON g.id = oi.game_id
+        ORDER BY page.created_at {direction}, page.id {direction}, oi.id
+    """
+
+# title matches weigh 10x more than description matches in bm25
+SEARCH_SQL = """
+    SELECT g.id, g.title, g.price, g.image_url,
+           highlight(games_fts, 0, ?, ?) AS title_hl,
+           snippet(games_fts, 1, ?, ?, '…', 24) AS snippet
+    FROM games_fts
+    JOIN games g ON g.id = games_fts.rowid
+    WHERE games_fts MATCH ?
+    ORDER BY bm25(games_fts, 10.0, 1.0)
+    LIMIT ? OFFSET ?
+"""
+
+
+# DB INIT 
+# Cheap when the schema is current (one PRAGMA user_version read).
+# seed_sample_games() is a no-op, so it is no longer called on every boot.
+init_db()
+
+
+def load_title_index():
+    """Loader for the autocomplete index: all titles plus units sold per game."""
     conn = get_connection()
     cur = conn.cursor()
+    cur.execute("SELECT id, title FROM games")
+    titles = [(row["id"], row["title"]) for row in cur.fetchall()]
     cur.execute(
-        "SELECT id, email, user_type, is_admin FROM users WHERE id = ?",
-        (user_id,)
+        "SELECT game_id, SUM(quantity) AS sold FROM order_items GROUP BY game_id"
+    )
+    popularity = {row["game_id"]: row["sold"] for row in cur.fetchall()}
+    return titles, popularity
+
+
+# user id -> {"id", "email", "user_type", "is_admin"}
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+
+def load_games(ids):
+    """Loader for the game cache: GameRecords for the given ids, in chunks."""
+    conn = get_connection()
+    cur = conn.cursor()
+    ids = list(ids)
+    records = []
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        cur.execute(games_by_ids_sql(len(chunk)), chunk)
+        records.extend(GameRecord.from_row(row) for row in cur.fetchall())
+    return records
+
+
+def load_catalog_version():
+    return get_catalog_version(get_connection())
+
+
+catalog_version = CatalogVersion(
+    load_catalog_version, check_interval=CATALOG_VERSION_CHECK_INTERVAL
+)
+
+# In-process autocomplete index, loaded on the first /api/suggest call and
+# reloaded when the catalog version changes
+title_index = TitleIndex(
+    load_title_index, catalog_version.current, top_size=SUGGEST_MAX_LIMIT
+)
+
+# cart id -> {game_id: quantity}
+cart_cache = LRUCache(maxsize=CART_CACHE_SIZE, ttl=CART_CACHE_TTL_SECONDS)
+
+# game id -> GameRecord, shared by game_detail / add_to_cart / checkout
+game_cache = GameCache(load_games, catalog_version.current, maxsize=GAME_CACHE_SIZE)
+
+# rendered anonymous pages, keyed by path + query string
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES)
+
+
+_outbox_dispatcher = None
+_outbox_dispatcher_pid = None
+_outbox_dispatcher_lock = threading.Lock()
+
+
+def get_outbox_dispatcher():
+    """
+    Return this process's outbox dispatcher, starting it on first use
+    (and again in forked children, like db.get_writer()).
+    """
+    global _outbox_dispatcher, _outbox_dispatcher_pid
+    if _outbox_dispatcher is None or _outbox_dispatcher_pid != os.getpid():
+        with _outbox_dispatcher_lock:
+            if _outbox_dispatcher is None or _outbox_dispatcher_pid != os.getpid():
+                _outbox_dispatcher = OutboxDispatcher(
+                    claim=lambda limit: run_write(
+                        claim_outbox_events, limit, OUTBOX_LEASE_SECONDS
+                    ),
+                    complete=lambda ids: run_write(mark_outbox_delivered, ids),
+                    fail=lambda failures: run_write(reschedule_outbox_events, failures),
+                    purge=lambda: run_write(purge_delivered_outbox, OUTBOX_RETENTION_SECONDS),
+                    poll_interval=OUTBOX_POLL_INTERVAL,
+                    max_attempts=OUTBOX_MAX_ATTEMPTS,
+                    transport=order_transport,
+                    purge_interval=OUTBOX_PURGE_INTERVAL,
+                )
+                _outbox_dispatcher_pid = os.getpid()
+    return _outbox_dispatcher
+
+
+_order_event_consumer = None
+_order_event_consumer_pid = None
+_order_event_consumer_lock = threading.Lock()
+
+
+def consume_order_events(messages):
+    """Consumer handler: apply a batch of order events with one write."""
+    updates, rejected = order_event_updates(messages)
+    if updates:
+        run_write(apply_order_events, updates)
+    return rejected
+
+
+def log_parked_events(messages):
+    for message in messages:
+        print("Parked order event:", message.message_id, message.raw_body)
+
+
+def get_order_event_consumer():
+    """Return this process's order event consumer, started in a daemon thread."""
+    global _order_event_consumer, _order_event_consumer_pid
+    if _order_event_consumer is None or _order_event_consumer_pid != os.getpid():
+        with _order_event_consumer_lock:
+            if _order_event_consumer is None or _order_event_consumer_pid != os.getpid():
+                _order_event_consumer = EventConsumer(
+                    order_transport,
+                    handle=consume_order_events,
+                    park=log_parked_events,
+                    workers=2,
+                    wait_seconds=2,
+                    report_interval=None,
+                )
+                threading.Thread(
+                    target=_order_event_consumer.run, name="order-event-consumer", daemon=True
+                ).start()
+                _order_event_consumer_pid = os.getpid()
+    return _order_event_consumer
+
+
+_image_upload_pool = None
+_image_upload_pool_pid = None
+_image_upload_pool_lock = threading.Lock()
+
+
+def upload_spooled_image(row):
+    return image_store.upload_file(row["spool_path"], row["image_key"])
+
+
+def finish_image_upload(row, image_url):
+    """Point the game at its uploaded image and drop the spool file if unused."""
+    (updated, remaining), *versions = run_write(
+        catalog_write, complete_image_upload, row["game_id"], row["image_key"], image_url
+    )
+    if updated:
+        catalog_changed(row["game_id"])
+        # the title is unchanged: nothing for the autocomplete index to reload
+        title_index.applied(*versions)
+    if not remaining:
+        remove_spool_file(row["spool_path"])
+
+
+def remove_spool_file(spool_path):
+    """Remove a spooled image no pending upload uses any more (None is a no-op)."""
+    if spool_path:
+        try:
+            os.remove(spool_path)
+        except OSError:
+            pass
+
+
+def get_image_upload_pool():
+    """Return this process's image upload pool, like get_outbox_dispatcher()."""
+    global _image_upload_pool, _image_upload_pool_pid
+    if _image_upload_pool is None or _image_upload_pool_pid != os.getpid():
+        with _image_upload_pool_lock:
+            if _image_upload_pool is None or _image_upload_pool_pid != os.getpid():
+                _image_upload_pool = ImageUploadPool(
+                    claim=lambda limit: run_write(
+                        claim_image_uploads, limit, IMAGE_UPLOAD_LEASE_SECONDS
+                    ),
+                    upload=upload_spooled_image,
+                    complete=finish_image_upload,
+                    fail=lambda failures: run_write(reschedule_image_uploads, failures),
+                    workers=IMAGE_UPLOAD_WORKERS,
+                    poll_interval=IMAGE_UPLOAD_POLL_INTERVAL,
+                    max_attempts=IMAGE_UPLOAD_MAX_ATTEMPTS,
+                )
+                _image_upload_pool_pid = os.getpid()
+    return _image_upload_pool
+
+
+def catalog_changed(game_id=None):
+    """
+    Call after committing a write to games: drops the cached record and
+    re-reads the catalog version, which invalidates every cached page.
+    """
+    game_cache.invalidate(game_id)
+    catalog_version.refresh()
+
+
+@app.cli.command("compress-assets")
+def compress_assets_command():
+    """Write .gz siblings for static text assets (run at build time)."""
+    written = precompress_static_assets()
+    print(f"Compressed {written} static file(s).")
+
+
+@app.cli.command("expire-carts")
+def expire_carts_command():
+    """Delete anonymous carts untouched for CART_TTL_SECONDS."""
+    expired = run_write(expire_carts, CART_TTL_SECONDS)
+    print(f"Expired {expired} cart(s).")
+
+
+@app.cli.command("rebuild-search")
+def rebuild_search_command():
+    """Rebuild the full-text search index for existing games."""
+    rebuild_search_index()
+    print("Search index rebuilt.")
+
+
+def query_plan_checks():
+    """
+    Yield (name, query, params, options) for every hot query the views run.
+
+    options are passed to db.find_plan_problems(); catalog pages are
+    `bounded` because they walk an index in order and stop at the LIMIT.
+    """
+    yield "current user", USER_BY_ID_SQL, (1,), {}
+    yield "login", USER_BY_EMAIL_SQL, ("buyer@example.com",), {}
+    yield "games by ids", games_by_ids_sql(3), (1, 2, 3), {}
+    yield "checkout cart games", db.cart_games_sql(3), (1, 2, 3), {}
+    yield "cart items", db.CART_ITEMS_SQL, ("user:1",), {}
+    yield "catalog version", db.CATALOG_VERSION_SQL, (), {}
+    yield "catalog meta", CATALOG_META_SQL, (), {}
+    yield "game updated_at", GAME_UPDATED_AT_SQL, (1,), {}
+    yield "seller game", SELLER_GAME_SQL, (1, 1), {}
+    yield "seller dashboard", SELLER_GAMES_SQL, (1,), {}
+    # the outer ORDER BY only sorts the rows of one page
+    yield "my orders", order_history_sql(False, False), (1, 11), {"allow_sort": True}
+    yield "my orders after", order_history_sql(False, True), (1, "2024-01-01", 5, 11), {"allow_sort": True}
+    yield "my orders before", order_history_sql(True, True), (1, "2024-01-01", 5, 11), {"allow_sort": True}
+    yield "outbox claim", db.OUTBOX_CLAIM_SQL, (0.0, 100), {}
+    yield "outbox purge", db.OUTBOX_PURGE_SQL, ("-604800 seconds",), {}
+    yield "image upload claim", db.IMAGE_UPLOAD_CLAIM_SQL, (0.0, 4), {}
+    yield (
+        "search",
+        SEARCH_SQL,
+        ("", "", "", "", '"game"*', SEARCH_PAGE_SIZE + 1, 0),
+        {"allow_sort": True},
+    )
+
+    filter_sets = [
+        {},
+        {"seller_id": 1},
+        {"min_price": 5.0, "max_price": 20.0},
+        {"seller_id": 1, "min_price": 5.0},
+    ]
+    for sort, (column, _) in CATALOG_SORTS.items():
+        cursor = ("m" if column == "title" else 10, 10)
+        for filters in filter_sets:
+            for page in ("first", "after", "before"):
+                query, params, _ = build_catalog_query(
+                    sort,
+                    after=cursor if page == "after" else None,
+                    before=cursor if page == "before" else None,
+                    **filters
+                )
+                name = f"catalog {sort} {page} {filters or ''}".strip()
+                yield name, query, params, {"bounded": True}
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """EXPLAIN every hot query and fail if any falls back to a table scan or sort."""
+    conn = get_connection()
+    failures = 0
+    for name, query, params, options in query_plan_checks():
+        problems = find_plan_problems(conn, query, params, **options)
+        if problems:
+            failures += 1
+            print(f"FAIL {name}: {'; '.join(problems)}")
+        else:
+            print(f"ok   {name}")
+
+    if failures:
+        print(f"{failures} hot queries have query plan regressions.")
+        sys.exit(1)
+    print("All hot queries use indexes.")
+
+
+@app.cli.command("check-query-counts")
+def check_query_counts_command():
+    """Request each route in ROUTE_QUERY_BUDGETS and fail if it runs more statements than allowed."""
+    enable_sql_tracing()
+    row = get_connection().execute("SELECT MIN(id) FROM games").fetchone()
+    game_id = row[0] or 1
+    failures = 0
+    for route, budget in ROUTE_QUERY_BUDGETS.items():
+        path = route.format(game_id=game_id)
+        # a fresh client (no cookies) and cold page caches for each route
+        response_cache.clear()
+        try:
+            with assert_max_queries(sql_tracer, budget, f"GET {path}") as trace:
+                response = app.test_client().get(path)
+        except AssertionError as e:
+            failures += 1
+            print(f"FAIL {e}")
+            continue
+        print(f"ok   GET {path}: {trace.count}/{budget} queries ({response.status_code})")
+
+    if failures:
+        print(f"{failures} routes run more queries than their budget.")
+        sys.exit(1)
+    print("All routes are within their query budgets.")
+
+# HELPERS 
+def user_cart_id(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def get_cart_id():
+    """
+    The current visitor's cart id: derived from the user id when logged in,
+    otherwise the opaque id in the cart cookie (None if there is no cart yet).
+    """
+    if session.get("user_id"):
+        return user_cart_id(session["user_id"])
+    if "cart_cookie" in g:
+        # the cart was created or dropped earlier in this request
+        return g.cart_cookie or None
+    return visitor_cart_cookie()
+
+
+def visitor_cart_cookie():
+    """The anonymous cart id from the cookie, or None if absent or not one we issued."""
+    cart_id = request.cookies.get(CART_COOKIE_NAME)
+    if cart_id and VISITOR_CART_ID_RE.fullmatch(cart_id):
+        return cart_id
+    return None
+
+
+def get_cart():
+    """Return the current cart as {game_id: quantity}, read once per request."""
+    if "cart" not in g:
+        cart_id = get_cart_id()
+        cart = {}
+        if cart_id:
+            cart = cart_cache.get(cart_id)
+            if cart is None:
+                cart = load_cart_items(get_connection(), cart_id)
+                cart_cache.set(cart_id, cart)
+        g.cart = cart
+    return g.cart
+
+
+def change_cart(unit, *args, idempotency_key=None):
+    """
+    Apply a cart write unit (db.cart_*) to the visitor's cart, giving an
+    anonymous visitor a new cart id on the first change.
+
+    With an idempotency_key the change is applied at most once; returns
+    whether it was applied by this call.
+    """
+    cart_id = get_cart_id()
+    had_cart = cart_id is not None
+    if not had_cart:
+        cart_id = secrets.token_urlsafe(CART_ID_BYTES)
+    scope = idempotency_scope() if idempotency_key is not None else None
+    changed_cart_id, applied = run_write(
+        cart_change_once, scope, cart_id, idempotency_key, unit, *args
     )
-    user = cur.fetchone()
-    conn.close()
+    if not had_cart:
+        # a replayed first change (keys are scoped to this user / session)
+        # joins the cart its original request created
+        cart_id = changed_cart_id
+    if not session.get("user_id"):
+        # (re)sent on every change so abandoned carts expire from the last one
+        g.cart_cookie = cart_id
+    cart_cache.pop(cart_id)
+    g.pop("cart", None)
+    return applied
+
+
+def idempotency_scope():
+    """
+    Whose idempotency keys a cart request may match: the logged-in user's,
+    else those sent earlier in this visitor's session.
+    """
+    if session.get("user_id"):
+        return user_cart_id(session["user_id"])
+    scope = session.get("cart_scope")
+    if scope is None:
+        scope = session["cart_scope"] = secrets.token_urlsafe(CART_ID_BYTES)
+    return scope
+
+
+def merge_visitor_cart(user_id):
+    """On login, fold the anonymous cart from the cookie into the user's cart."""
+    visitor_cart_id = visitor_cart_cookie()
+    if not visitor_cart_id:
+        if request.cookies.get(CART_COOKIE_NAME):
+            g.cart_cookie = ""
+        return
+    run_write(merge_carts, visitor_cart_id, user_cart_id(user_id), user_id)
+    cart_cache.pop(visitor_cart_id)
+    cart_cache.pop(user_cart_id(user_id))
+    g.cart_cookie = ""
+
+
+def get_current_user():
+    """
+    Return the logged-in user (id, email, user_type, is_admin) or None.
+
+    Memoized on g for the rest of the request and cached per process for
+    USER_CACHE_TTL_SECONDS, so most requests never query the users table.
+    """
+    if "current_user" in g:
+        return g.current_user
+
+    user = None
+    user_id = session.get("user_id")
+    if user_id:
+        user = user_cache.get(user_id)
+        if user is None:
+            conn = get_connection()
+            cur = conn.cursor()
+            cur.execute(USER_BY_ID_SQL, (user_id,))
+            row = cur.fetchone()
+            if row is not None:
+                user = dict(row)
+                user_cache.set(user_id, user)
+
+    g.current_user = user
     return user
 
 
+def invalidate_cached_user(user_id):
+    """Drop a user from the cache; call after any UPDATE / DELETE on users."""
+    user_cache.pop(user_id)
+    if g.get("current_user") and g.current_user["id"] == user_id:
+        g.pop("current_user")
+
+
 def require_login():
     user = get_current_user()
     if not user:
@@ -68,19 +803,504 @@ def require_seller():
     return user
 
 
+def is_anonymous_browse():
+    """True if this request renders the same page for every visitor."""
+    return (
+        not session.get("user_id")
+        and not get_cart_id()
+        and "_flashes" not in session
+    )
+
+
+def page_validators():
+    """
+    Return (etag, last_modified) for the current catalog / game page, or None.
+
+    Costs one primary-key lookup. The ETag covers the data version and
+    everything else that changes the rendered page (user, cart, query
+    string, release); Last-Modified is only given for anonymous pages,
+    since a cart change does not move any timestamp.
+    """
+    conn = get_connection()
+    if request.endpoint == "game_detail":
+        game_id = request.view_args["game_id"]
+        row = conn.execute(GAME_UPDATED_AT_SQL, (game_id,)).fetchone()
+        if row is None:
+            return None
+        resource = f"game:{game_id}:{row['updated_at']}"
+        updated_at = row["updated_at"]
+    else:
+        row = conn.execute(CATALOG_META_SQL).fetchone()
+        resource = f"catalog:{row['version']}"
+        updated_at = row["updated_at"]
+
+    cart_state = sorted(get_cart().items())
+    etag = make_etag(
+        resource, session.get("user_id"), cart_state, request.full_path, RELEASE_ID
+    )
+
+    last_modified = None
+    if is_anonymous_browse():
+        last_modified = parse_sqlite_timestamp(updated_at)
+    return etag, last_modified
+
+
+def record_query(sql, seconds):
+    """db.query_listeners hook: count statements per request and endpoint."""
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+        endpoint = request.endpoint or "unmatched"
+    else:
+        endpoint = "background"
+    metrics.inc(DB_QUERIES_TOTAL, endpoint=endpoint)
+    metrics.inc(DB_QUERY_SECONDS_TOTAL, seconds, endpoint=endpoint)
+
+
+def start_render_timer(sender, template, context, **extra):
+    g.setdefault("render_started", []).append(time.perf_counter())
+
+
+def record_render_time(sender, template, context, **extra):
+    started = g.get("render_started")
+    if started:
+        metrics.observe(
+            TEMPLATE_RENDER_SECONDS,
+            time.perf_counter() - started.pop(),
+            template=template.name,
+        )
+
+
+if METRICS_ENABLED:
+    db.query_listeners.append(record_query)
+    before_render_template.connect(start_render_timer, app)
+    template_rendered.connect(record_render_time, app)
+
+
+# Registered first so the timer spans every other hook (after_request hooks
+# run in reverse order, so record_request_metrics runs last)
+@app.before_request
+def start_request_timer():
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+
+_next_metrics_flush = 0.0
+
+
+@app.after_request
+def record_request_metrics(response):
+    global _next_metrics_flush
+    started = g.get("request_started")
+    if started is None:
+        return response
+
+    endpoint = request.endpoint or "unmatched"
+    metrics.observe(
+        REQUEST_SECONDS,
+        time.perf_counter() - started,
+        endpoint=endpoint,
+        method=request.method,
+        status=str(response.status_code),
+    )
+    metrics.observe(REQUEST_DB_QUERIES, g.get("db_queries", 0), endpoint=endpoint)
+
+    if METRICS_DIR and time.monotonic() >= _next_metrics_flush:
+        _next_metrics_flush = time.monotonic() + METRICS_FLUSH_INTERVAL
+        try:
+            metrics.write_snapshot(METRICS_DIR)
+        except OSError as e:
+            print("Metrics flush error:", e)
+    return response
+
+
+sql_tracer = SQLTracer(
+    slow_seconds=SQL_SLOW_QUERY_MS / 1000, repeat_threshold=SQL_REPEAT_THRESHOLD
+)
+
+
+def enable_sql_tracing():
+    """Trace every connection opened from now on (idempotent)."""
+    if sql_tracer.attach not in db.connection_hooks:
+        db.connection_hooks.append(sql_tracer.attach)
+        db.query_listeners.append(sql_tracer.on_query)
+        db.row_listeners.append(sql_tracer.on_rows)
+
+
+if SQL_TRACE_ENABLED:
+    enable_sql_tracing()
+
+
+@app.before_request
+def start_sql_trace():
+    if SQL_TRACE_ENABLED:
+        g.sql_trace = sql_tracer.start(f"{request.method} {request.full_path.rstrip('?')}")
+
+
+@app.after_request
+def add_sql_timing(response):
+    trace = g.get("sql_trace")
+    if trace is not None:
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={trace.seconds * 1000:.2f};desc="{trace.count} queries, {trace.rows} rows"',
+        )
+    return response
+
+
+@app.teardown_request
+def finish_sql_trace(exc):
+    # teardown runs even when a view or after_request hook raises, so the
+    # trace never leaks into the next request on this thread
+    trace = g.pop("sql_trace", None)
+    if trace is None:
+        return
+    sql_tracer.finish()
+    if SQL_TRACE_VERBOSE:
+        print(trace.format())
+
+
+@app.before_request
+def start_outbox_dispatcher():
+    if OUTBOX_DISPATCHER_ENABLED:
+        get_outbox_dispatcher()
+    if ORDER_EVENT_CONSUMER_ENABLED:
+        get_order_event_consumer()
+
+
+@app.before_request
+def start_image_upload_pool():
+    if IMAGE_UPLOADS_ASYNC:
+        get_image_upload_pool()
+
+
+_next_cart_expiry = 0.0
+
+
+@app.before_request
+def expire_abandoned_carts():
+    """Every CART_EXPIRY_INTERVAL seconds, queue a purge of stale anonymous carts."""
+    global _next_cart_expiry
+    now = time.monotonic()
+    if now < _next_cart_expiry:
+        return
+    _next_cart_expiry = now + CART_EXPIRY_INTERVAL
+    # fire and forget: the writer thread runs it between other writes
+    db.get_writer().submit(expire_carts, CART_TTL_SECONDS)
+
+
+@app.after_request
+def set_cart_cookie(response):
+    cart_cookie = g.get("cart_cookie")
+    if cart_cookie:
+        response.set_cookie(
+            CART_COOKIE_NAME,
+            cart_cookie,
+            max_age=CART_TTL_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
+    elif cart_cookie == "":
+        response.delete_cookie(CART_COOKIE_NAME)
+    return response
+
+
+@app.before_request
+def answer_conditional_get():
+    if request.method not in ("GET", "HEAD") or request.endpoint not in CONDITIONAL_ENDPOINTS:
+        return None
+    # pages with pending flash messages are one-off renders
+    if "_flashes" in session:
+        return None
+
+    validators = page_validators()
+    if validators is None:
+        return None
+    g.page_validators = validators
+    etag, last_modified = validators
+
+    not_modified = False
+    if request.if_none_match:
+        if request.if_none_match.contains(etag + "-gz"):
+            # answer with the tag the client holds
+            g.page_validators = (etag + "-gz", last_modified)
+            not_modified = True
+        else:
+            not_modified = request.if_none_match.contains(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        not_modified = last_modified <= request.if_modified_since
+
+    if not_modified:
+        return Response(status=304)
+    return None
+
+
+@app.after_request
+def add_page_validators(response):
+    validators = g.get("page_validators")
+    if validators is None or response.status_code not in (200, 304):
+        return response
+
+    etag, last_modified = validators
+    # a gzip-encoded body is a different representation: give it its own tag
+    if response.headers.get("Content-Encoding") == "gzip":
+        etag += "-gz"
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+        response.headers["Cache-Control"] = "public, no-cache"
+    else:
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# Registered between the two page-cache hooks on purpose: after_request hooks
+# run in reverse order, so this sees the body after store_cached_response has
+# cached it uncompressed and before add_page_validators picks the ETag.
+@app.after_request
+def compress_response(response):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or not is_compressible(response.mimetype)
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if not request.accept_encodings["gzip"]:
+        return response
+
+    length = response.calculate_content_length()
+    if length is None or not COMPRESS_MIN_BYTES <= length <= COMPRESS_MAX_BYTES:
+        return response
+
+    response.set_data(gzip.compress(response.get_data(), compresslevel=COMPRESS_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@app.before_request
+def serve_cached_response():
+    if request.method != "GET" or request.endpoint not in RESPONSE_CACHE_ENDPOINTS:
+        return None
+
+    if not is_anonymous_browse():
+        g.response_cache = "BYPASS"
+        return None
+
+    g.response_cache_version = catalog_version.current()
+    entry = response_cache.get(request.full_path, g.response_cache_version)
+    if entry is None:
+        g.response_cache = "MISS"
+        return None
+
+    g.response_cache = "HIT"
+    if request.accept_encodings["gzip"]:
+        response = Response(entry.body_gz, status=entry.status, content_type=entry.content_type)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(entry.body, status=entry.status, content_type=entry.content_type)
+    return response
+
+
+@app.after_request
+def store_cached_response(response):
+    state = g.get("response_cache")
+    if state is None:
+        return response
+
+    if (
+        state == "MISS"
+        and response.status_code == 200
+        and response.mimetype == "text/html"
+        and not response.direct_passthrough
+        and is_anonymous_browse()
+    ):
+        response_cache.set(
+            request.full_path,
+            g.response_cache_version,
+            response.status_code,
+            response.content_type,
+            response.get_data(),
+        )
+
+    # cached hits may be served gzip-encoded
+    response.vary.add("Accept-Encoding")
+    response.headers["X-Cache"] = state
+    return response
+
+
 def allowed_file(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-# PUBLIC ROUTES 
+def store_game_image(image_file):
+    """
+    Save an uploaded image and return (image_url, pending_image).
+
+    Inline uploads return the stored URL; with IMAGE_UPLOADS_ASYNC the file
+    is only spooled and pending_image is the (image_key, spool_path) to queue
+    with the game write. Returns (None, None), with a flash message, if the
+    file is not an allowed image or the store fails.
+    """
+    if not allowed_file(image_file.filename):
+        flash("Invalid image type. Allowed: png, jpg, jpeg, gif.")
+        return None, None
+
+    extension = image_extension(image_file.filename)
+    try:
+        if IMAGE_UPLOADS_ASYNC:
+            stored = image_spool.save(image_file.stream, extension)
+            return None, (stored.key, image_spool.path_for(stored.key))
+        stored = image_store.save(image_file.stream, extension)
+    except RuntimeError as e:
+        flash(f"Image upload failed: {e}")
+        return None, None
+    return stored.url, None
+
+
+def parse_float_arg(name):
+    value = request.args.get(name, "").strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def parse_id_arg(name):
+    """An integer id query arg, or None if missing, malformed or out of SQLite's range."""
+    value = request.args.get(name, type=int)
+    return value if is_sqlite_int(value) else None
+
+
+def build_catalog_query(sort, seller_id=None, min_price=None, max_price=None,
+                        after=None, before=None, per_page=CATALOG_PAGE_SIZE):
+    """
+    Build the keyset-paginated catalog query for fetch_catalog_page().
+
+    Returns (query, params, backwards); backwards is True when paging with a
+    `before` cursor, in which case rows come back in reverse display order.
+    """
+    column, direction = CATALOG_SORTS[sort]
+    backwards = before is not None and after is None
+    if backwards:
+        direction = "ASC" if direction == "DESC" else "DESC"
+
+    where = []
+    params = []
+
+    if seller_id is not None:
+        where.append("seller_id = ?")
+        params.append(seller_id)
+    # Unless sorting by price, "+price" keeps SQLite from picking the price
+    # index for the range filter and then sorting every match: walking the
+    # sort-order index and filtering stops after one page instead.
+    price = "price" if column == "price" else "+price"
+    if min_price is not None:
+        where.append(f"{price} >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        where.append(f"{price} <= ?")
+        params.append(max_price)
+
+    cursor = before if backwards else after
+    if cursor is not None:
+        op = "<" if direction == "DESC" else ">"
+        if column == "id":
+            where.append(f"id {op} ?")
+            params.append(cursor[1])
+        else:
+            where.append(f"({column}, id) {op} (?, ?)")
+            params.extend(cursor)
+
+    query = "SELECT id, title, description, price, image_url, seller_id FROM games"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    if column == "id":
+        query += f" ORDER BY id {direction}"
+    else:
+        query += f" ORDER BY {column} {direction}, id {direction}"
+    query += " LIMIT ?"
+    params.append(per_page + 1)
+
+    return query, params, backwards
+
+
+def fetch_catalog_page(sort, seller_id=None, min_price=None, max_price=None,
+                       after=None, before=None, per_page=CATALOG_PAGE_SIZE):
+    """
+    Fetch one page of the storefront catalog using keyset pagination.
+
+    `after` / `before` are decoded cursors (sort value, id) of the last row of
+    the previous page or the first row of the next page. Rows are located by
+    seeking in the matching index, so every page costs the same no matter how
+    deep into the catalog it is.
+
+    Returns (games, has_prev, has_next).
+    """
+    query, params, backwards = build_catalog_query(
+        sort, seller_id, min_price, max_price, after, before, per_page
+    )
 
-@app.route("/")
-def index():
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute("SELECT * FROM games")
+    cur.execute(query, params)
     games = cur.fetchall()
-    conn.close()
+
+    has_more = len(games) > per_page
+    games = games[:per_page]
+
+    if backwards:
+        games.reverse()
+        return games, has_more, True
+
+    return games, after is not None, has_more
+
+
+def catalog_cursor(game, sort):
+    column = CATALOG_SORTS[sort][0]
+    return encode_cursor(game[column], game["id"])
+
+
+# PUBLIC ROUTES 
+
+@app.route("/")
+def index():
+    sort = request.args.get("sort", "newest")
+    if sort not in CATALOG_SORTS:
+        sort = "newest"
+
+    seller_id = parse_id_arg("seller")
+    min_price = parse_float_arg("min_price")
+    max_price = parse_float_arg("max_price")
+
+    games, has_prev, has_next = fetch_catalog_page(
+        sort,
+        seller_id=seller_id,
+        min_price=min_price,
+        max_price=max_price,
+        after=decode_cursor(request.args.get("after")),
+        before=decode_cursor(request.args.get("before")),
+    )
+
+    # query args shared by the next / prev links (everything but the cursor)
+    filters = {"sort": sort}
+    if seller_id is not None:
+        filters["seller"] = seller_id
+    if min_price is not None:
+        filters["min_price"] = request.args.get("min_price")
+    if max_price is not None:
+        filters["max_price"] = request.args.get("max_price")
+
+    prev_url = None
+    next_url = None
+    if games and has_prev:
+        prev_url = url_for("index", before=catalog_cursor(games[0], sort), **filters)
+    if games and has_next:
+        next_url = url_for("index", after=catalog_cursor(games[-1], sort), **filters)
 
     cart = get_cart()
     cart_count = cart_item_count(cart)
@@ -90,11 +1310,142 @@ def index():
         "index.html",
         title="Game Store",
         games=games,
+        sort=sort,
+        filters=filters,
+        prev_url=prev_url,
+        next_url=next_url,
+        cart_count=cart_count,
+        user=user
+    )
+
+
+@app.route("/search")
+def search():
+    q = request.args.get("q", "").strip()
+    page = request.args.get("page", 1, type=int)
+    page = min(max(page, 1), SEARCH_MAX_PAGE)
+
+    results = []
+    has_next = False
+    match = build_fts_query(q)
+
+    if match:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(
+            SEARCH_SQL,
+            (
+                HIGHLIGHT_START, HIGHLIGHT_END,
+                HIGHLIGHT_START, HIGHLIGHT_END,
+                match,
+                SEARCH_PAGE_SIZE + 1,
+                (page - 1) * SEARCH_PAGE_SIZE,
+            )
+        )
+        rows = cur.fetchall()
+
+        has_next = len(rows) > SEARCH_PAGE_SIZE and page < SEARCH_MAX_PAGE
+        for row in rows[:SEARCH_PAGE_SIZE]:
+            results.append(
+                {
+                    "id": row["id"],
+                    "title": highlight_markup(row["title_hl"]),
+                    "price": row["price"],
+                    "image_url": row["image_url"],
+                    "snippet": highlight_markup(row["snippet"]),
+                }
+            )
+
+    cart = get_cart()
+    cart_count = cart_item_count(cart)
+    user = get_current_user()
+
+    return render_template(
+        "search.html",
+        title=f"Search: {q}" if q else "Search",
+        q=q,
+        results=results,
+        page=page,
+        has_prev=page > 1,
+        has_next=has_next,
         cart_count=cart_count,
         user=user
     )
 
 
+@app.route("/api/suggest")
+def api_suggest():
+    q = request.args.get("q", "")
+    limit = request.args.get("limit", SUGGEST_DEFAULT_LIMIT, type=int)
+    limit = min(max(limit, 1), SUGGEST_MAX_LIMIT)
+
+    suggestions = [
+        {"id": game_id, "title": title}
+        for game_id, title in title_index.suggest(q, limit)
+    ]
+    return jsonify({"q": q, "suggestions": suggestions})
+
+
+@app.route("/api/cache-stats")
+def api_cache_stats():
+    return jsonify(
+        {
+            "games": game_cache.stats(),
+            "users": user_cache.stats(),
+            "pages": response_cache.stats(),
+        }
+    )
+
+
+@app.route("/assets/<digest>/<path:filename>")
+def static_asset(digest, filename):
+    """Serve a fingerprinted static file; stale digests are not cached long."""
+    gz_path = None
+    if request.accept_encodings["gzip"]:
+        gz_path = gzip_sibling(safe_join(app.static_folder, filename) or "")
+
+    if gz_path:
+        response = send_from_directory(
+            app.static_folder,
+            filename + ".gz",
+            mimetype=mimetypes.guess_type(filename)[0],
+        )
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = send_from_directory(app.static_folder, filename)
+    response.vary.add("Accept-Encoding")
+
+    if asset_manifest.is_current(filename, digest):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+@app.route("/images/<key>")
+def game_image(key):
+    """Serve a locally stored, content-addressed game image."""
+    if not is_image_key(key) or not isinstance(image_store, LocalImageStore):
+        abort(404)
+    response = send_from_directory(image_store.root, key)
+    response.headers["Cache-Control"] = IMAGE_CACHE_CONTROL
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape target: this worker's metrics, or all workers' with METRICS_DIR."""
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(
+        metrics.render(metrics.collect(METRICS_DIR)),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
 @app.route("/about")
 def about():
     user = get_current_user()
@@ -111,11 +1462,7 @@ def about():
 
 @app.route("/game/<int:game_id>")
 def game_detail(game_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM games WHERE id = ?", (game_id,))
-    game = cur.fetchone()
-    conn.close()
+    game = game_cache.get(game_id)
 
     if game is None:
         flash("Game not found.")
@@ -136,30 +1483,13 @@ def game_detail(game_id):
 
 @app.route("/add-to-cart/<int:game_id>")
 def add_to_cart(game_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM games WHERE id = ?", (game_id,))
-    game = cur.fetchone()
-    conn.close()
+    game = game_cache.get(game_id)
 
     if game is None:
         flash("Game not found.")
         return redirect(url_for("index"))
 
-    cart = get_cart()
-    key = str(game_id)
-
-    if key in cart:
-        cart[key]["quantity"] += 1
-    else:
-        cart[key] = {
-            "id": game["id"],
-            "title": game["title"],
-            "price": float(game["price"]),
-            "quantity": 1
-        }
-
-    save_cart(cart)
+    change_cart(cart_add_item, session.get("user_id"), game_id, 1)
     flash(f"Added {game['title']} to cart.")
     return redirect(url_for("cart"))
 
@@ -167,24 +1497,121 @@ def add_to_cart(game_id):
 @app.route("/cart")
 def cart():
     cart = get_cart()
+    games = game_cache.get_many(cart)
 
-    total = calculate_cart_total(cart)
+    total = calculate_cart_total(cart, games)
     cart_count = cart_item_count(cart)
     user = get_current_user()
 
     return render_template(
         "cart.html",
         title="Your Cart",
-        cart_items=cart,
+        cart_items=cart_lines(cart, games),
         total=total,
         cart_count=cart_count,
         user=user
     )
 
 
+#  JSON CART API 
+# Used by static/js/cart.js so adding to the cart is one small request
+# instead of a redirect plus a full cart page render. Bodies must be
+# application/json, which cross-site forms cannot send. Changes accept an
+# Idempotency-Key header: repeating a key (double click, retry) is a no-op
+# that just returns the current cart.
+
+def cart_summary(applied=None):
+    cart = get_cart()
+    games = game_cache.get_many(cart)
+    summary = {
+        "count": cart_item_count(cart),
+        "total": round(calculate_cart_total(cart, games), 2),
+        "items": list(cart_lines(cart, games).values()),
+    }
+    if applied is not None:
+        summary["applied"] = applied
+    return summary
+
+
+def cart_api_error(message, status=400):
+    return jsonify({"error": message}), status
+
+
+def read_cart_request(require_quantity=False, default_quantity=1, minimum=1):
+    """
+    Parse a cart API request: returns (data, quantity, idempotency_key, error)
+    where error is a ready-made error response or None.
+    """
+    data = request.get_json(silent=True)
+    if data is None or not isinstance(data, dict):
+        return None, None, None, cart_api_error("Expected a JSON object body.", 415)
+
+    if require_quantity and "quantity" not in data:
+        return data, None, None, cart_api_error("quantity is required.")
+    quantity = data.get("quantity", default_quantity)
+    if type(quantity) is not int or not minimum <= quantity <= MAX_CART_QUANTITY:
+        return data, None, None, cart_api_error(
+            f"quantity must be an integer from {minimum} to {MAX_CART_QUANTITY}."
+        )
+
+    key = request.headers.get("Idempotency-Key", "").strip() or None
+    if key is not None and not 8 <= len(key) <= 128:
+        return data, None, None, cart_api_error("Idempotency-Key must be 8-128 characters.")
+    return data, quantity, key, None
+
+
+@app.route("/api/cart")
+def api_cart():
+    return jsonify(cart_summary())
+
+
+@app.route("/api/cart/items", methods=["POST"])
+def api_cart_add():
+    data, quantity, key, error = read_cart_request()
+    if error:
+        return error
+
+    game_id = data.get("game_id")
+    if type(game_id) is not int or game_cache.get(game_id) is None:
+        return cart_api_error("Game not found.", 404)
+
+    applied = change_cart(
+        cart_add_item, session.get("user_id"), game_id, quantity, idempotency_key=key
+    )
+    return jsonify(cart_summary(applied))
+
+
+@app.route("/api/cart/items/<int:game_id>", methods=["PUT"])
+def api_cart_set_quantity(game_id):
+    _, quantity, key, error = read_cart_request(require_quantity=True, minimum=0)
+    if error:
+        return error
+
+    if quantity and game_cache.get(game_id) is None:
+        return cart_api_error("Game not found.", 404)
+
+    applied = change_cart(
+        cart_set_quantity, session.get("user_id"), game_id, quantity, idempotency_key=key
+    )
+    return jsonify(cart_summary(applied))
+
+
+@app.route("/api/cart/items/<int:game_id>", methods=["DELETE"])
+def api_cart_remove(game_id):
+    # removing is idempotent by nature, so no key is needed
+    applied = False
+    if get_cart_id():
+        applied = change_cart(cart_remove_items, [game_id])
+    return jsonify(cart_summary(applied))
+
+
 @app.route("/cart/clear")
 def clear_cart():
-    session["cart"] = {}
+    if get_cart_id():
+        change_cart(cart_remove_items)
+        if not session.get("user_id"):
+            # back to an empty anonymous visitor, whose pages are cacheable
+            g.cart_cookie = ""
     flash("Cart cleared.")
     return redirect(url_for("cart"))
 
@@ -204,86 +1631,141 @@ def checkout():
         flash("Only logged-in buyers can check out.")
         return redirect(url_for("login"))
 
-    total = calculate_cart_total(cart)
+    # lines are always priced from the catalog; drop games deleted since
+    games = game_cache.get_many(cart)
+    missing = [game_id for game_id in cart if game_id not in games]
+    if missing:
+        change_cart(cart_remove_items, missing)
+        flash("Some games in your cart are no longer available and were removed.")
+        return redirect(url_for("checkout" if len(missing) < len(cart) else "cart"))
 
     if request.method == "POST":
-        conn = get_connection()
-        cur = conn.cursor()
+        # the prices the checkout page showed, so a change since is not
+        # charged silently (place_order charges current prices)
+        shown_prices = {
+            game_id: request.form.get(f"price_{game_id}", type=float)
+            for game_id in cart
+        }
+        if None in shown_prices.values():
+            # a line added since the page was shown
+            flash("Your cart changed. Please review your order.")
+            return redirect(url_for("checkout"))
 
         created_at = datetime.utcnow().isoformat(timespec="seconds")
         status = "PLACED"
 
-        # 1) Create order
-        cur.execute(
-            "INSERT INTO orders (user_id, total_amount, created_at, status) "
-            "VALUES (?, ?, ?, ?)",
-            (user["id"], total, created_at, status)
-        )
-        order_id = cur.lastrowid
-
-        # 2) Create order items
-        items_for_queue = []
-        for item in cart.values():
-            cur.execute(
-                """
-                INSERT INTO order_items (order_id, game_id, quantity, price_each)
-                VALUES (?, ?, ?, ?)
-                """,
-                (order_id, item["id"], item["quantity"], item["price"])
-            )
-
-            items_for_queue.append(
-                {
-                    "game_id": item["id"],
-                    "title": item["title"],
-                    "quantity": int(item["quantity"]),
-                    "price": float(item["price"]),
-                }
-            )
-
-        conn.commit()
-        conn.close()
+        def order_events(items, total):
+            return [
+                ("sqs", build_order_event(user["id"], total, items)),
+                ("sns", build_order_notification(user["email"], total)),
+            ]
 
-        # 3) Clear cart in session
-        session["cart"] = {}
-
-        # 4) Send SQS message (non-critical: do not break checkout on failure)
+        # 1) + 2) + 3) Revalidate the shown prices against current ones, create
+        # the order, its items and its outbox events, and empty the cart in
+        # one write unit; the writer thread group-commits it with other
+        # concurrent writes
         try:
-            send_order_event_to_sqs(
-                order_id=order_id,
-                user_id=user["id"],
-                total=total,
-                items=items_for_queue,
+            order_id, total, items_for_queue = run_write(
+                place_order,
+                user["id"],
+                created_at,
+                status,
+                {
+                    game_id: (quantity, shown_prices[game_id])
+                    for game_id, quantity in cart.items()
+                },
+                order_events,
+                get_cart_id(),
             )
-        except RuntimeError as e:
-            # Log message to console; user still sees successful order
-            print("SQS send error:", e)
+        except StaleCartError as e:
+            # in case this process missed the change, let the caches catch
+            # up before the checkout page is shown again
+            catalog_version.refresh()
+            gone = [game_id for game_id in cart if game_id not in e.current]
+            if gone:
+                change_cart(cart_remove_items, gone)
+            flash("Some games in your cart changed price or are no longer available. "
+                  "Please review your order.")
+            return redirect(url_for("checkout" if len(gone) < len(cart) else "cart"))
+        except sqlite3.Error as e:
+            print("Checkout error:", e)
+            flash("Could not place your order. Please try again.")
+            return redirect(url_for("cart"))
+        cart_cache.pop(get_cart_id())
+
+        title_index.record_sales(
+            {item["game_id"]: item["quantity"] for item in items_for_queue}
+        )
 
-        # 5) Send SNS notification (also non-critical)
-        try:
-            notify_order_via_sns(
-                order_id=order_id,
-                user_email=user["email"],
-                total=total,
-            )
-        except RuntimeError as e:
-            print("SNS publish error:", e)
+        # 4) the order event + notification are delivered from the outbox
+        # to order_transport in the background (at-least-once); just wake
+        # the dispatcher
+        if OUTBOX_DISPATCHER_ENABLED:
+            get_outbox_dispatcher().notify()
 
         flash(f"Order {order_id} placed successfully.")
         return redirect(url_for("index"))
 
     # GET request: show checkout page
+    total = calculate_cart_total(cart, games)
     cart_count = cart_item_count(cart)
 
     return render_template(
         "checkout.html",
         title="Checkout",
-        cart_items=cart,
+        cart_items=cart_lines(cart, games),
         total=total,
         cart_count=cart_count,
         user=user
     )
 
+def fetch_order_history_page(user_id, after=None, before=None, per_page=ORDERS_PAGE_SIZE):
+    """
+    Fetch one page of a buyer's order history, newest first, with keyset
+    pagination on (created_at, id) like fetch_catalog_page().
+
+    Returns (orders, order_items_by_order, has_prev, has_next).
+    """
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+    params = [user_id]
+    if cursor is not None:
+        params.extend(cursor)
+    params.append(per_page + 1)
+
+    conn = get_connection()
+    rows = conn.execute(order_history_sql(backwards, cursor is not None), params).fetchall()
+
+    orders = []
+    order_items_by_order = {}
+    for row in rows:
+        if not orders or orders[-1]["id"] != row["id"]:
+            orders.append(
+                {
+                    "id": row["id"],
+                    "total_amount": row["total_amount"],
+                    "created_at": row["created_at"],
+                    "status": row["status"],
+                }
+            )
+        if row["quantity"] is not None:
+            order_items_by_order.setdefault(row["id"], []).append(
+                {
+                    "game_title": row["game_title"],
+                    "quantity": row["quantity"],
+                    "price_each": row["price_each"],
+                }
+            )
+
+    has_more = len(orders) > per_page
+    orders = orders[:per_page]
+
+    if backwards:
+        orders.reverse()
+        return orders, order_items_by_order, has_more, True
+    return orders, order_items_by_order, after is not None, has_more
+
+
 @app.route("/orders")
 def my_orders():
     user = get_current_user()
@@ -291,52 +1773,18 @@ def my_orders():
         flash("Please log in to view your orders.")
         return redirect(url_for("login"))
 
-    conn = get_connection()
-    cur = conn.cursor()
-
-    cur.execute(
-        """
-        SELECT id, total_amount, created_at, status
-        FROM orders
-        WHERE user_id = ?
-        ORDER BY created_at DESC
-        """,
-        (user["id"],)
+    after = decode_cursor(request.args.get("after"))
+    before = decode_cursor(request.args.get("before"))
+    orders, order_items_by_order, has_prev, has_next = fetch_order_history_page(
+        user["id"], after=after, before=before
     )
-    orders = cur.fetchall()
-
-    if not orders:
-        conn.close()
-        cart = get_cart()
-        cart_count = cart_item_count(cart)
-        return render_template(
-            "orders.html",
-            title="My Orders",
-            user=user,
-            cart_count=cart_count,
-            orders=[],
-            order_items_by_order={}
-        )
-
-    order_ids = [o["id"] for o in orders]
-
-    placeholders = ",".join("?" for _ in order_ids)
-    query = f"""
-        SELECT oi.order_id, oi.quantity, oi.price_each,
-               g.title AS game_title
-        FROM order_items oi
-        JOIN games g ON g.id = oi.game_id
-        WHERE oi.order_id IN ({placeholders})
-        ORDER BY oi.order_id
-    """
-    cur.execute(query, order_ids)
-    items = cur.fetchall()
-    conn.close()
 
-    order_items_by_order = {}
-    for row in items:
-        order_id = row["order_id"]
-        order_items_by_order.setdefault(order_id, []).append(row)
+    prev_url = None
+    next_url = None
+    if orders and has_prev:
+        prev_url = url_for("my_orders", before=encode_cursor(orders[0]["created_at"], orders[0]["id"]))
+    if orders and has_next:
+        next_url = url_for("my_orders", after=encode_cursor(orders[-1]["created_at"], orders[-1]["id"]))
 
     cart = get_cart()
     cart_count = cart_item_count(cart)
@@ -347,7 +1795,9 @@ def my_orders():
         user=user,
         cart_count=cart_count,
         orders=orders,
-        order_items_by_order=order_items_by_order
+        order_items_by_order=order_items_by_order,
+        prev_url=prev_url,
+        next_url=next_url
     )
 
 
@@ -361,12 +1811,8 @@ def seller_dashboard():
 
     conn = get_connection()
     cur = conn.cursor()
-    cur.execute(
-        "SELECT * FROM games WHERE seller_id = ? ORDER BY id DESC",
-        (user["id"],)
-    )
+    cur.execute(SELLER_GAMES_SQL, (user["id"],))
     games = cur.fetchall()
-    conn.close()
 
     cart = get_cart()
     cart_count = cart_item_count(cart)
@@ -402,38 +1848,23 @@ def seller_add_game():
                 flash("Price must be a valid number.")
             else:
                 # default no image
-                image_url = None
+                image_url, pending_image = None, None
 
                 # process image if provided
                 if image_file and image_file.filename:
-                    if allowed_file(image_file.filename):
-                        filename = secure_filename(image_file.filename)
-
-                        # prefix with seller id to avoid collisions
-                        filename = f"{user['id']}_{filename}"
-
-                        try:
-                            # Upload to S3 using your library function
-                            image_url = upload_game_image(image_file, filename)
-
-                        except RuntimeError as e:
-                            flash(f"Image upload failed: {e}")
-                            image_url = None
-                    else:
-                        flash("Invalid image type. Allowed: png, jpg, jpeg, gif.")
-
-                # Insert new game into DB
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute(
-                    """
-                    INSERT INTO games (title, description, price, image_url, seller_id)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (title, description, price, image_url, user["id"])
+                    image_url, pending_image = store_game_image(image_file)
+
+                # Insert new game into DB (and queue its image upload)
+                game_id, *versions = run_write(
+                    catalog_write,
+                    insert_game, title, description, price, image_url, user["id"],
+                    pending_image
                 )
-                conn.commit()
-                conn.close()
+                catalog_changed(game_id)
+                if pending_image:
+                    get_image_upload_pool().notify()
+                title_index.upsert(game_id, title)
+                title_index.applied(*versions)
 
                 flash("Game added successfully.")
                 return redirect(url_for("seller_dashboard"))
@@ -458,14 +1889,10 @@ def seller_edit_game(game_id):
     conn = get_connection()
     cur = conn.cursor()
 
-    cur.execute(
-        "SELECT * FROM games WHERE id = ? AND seller_id = ?",
-        (game_id, user["id"])
-    )
+    cur.execute(SELLER_GAME_SQL, (game_id, user["id"]))
     game = cur.fetchone()
 
     if not game:
-        conn.close()
         flash("Game not found or you do not have permission to edit it.")
         return redirect(url_for("seller_dashboard"))
 
@@ -485,31 +1912,26 @@ def seller_edit_game(game_id):
             else:
                 image_url = game["image_url"]
 
+                pending_image = None
                 if image_file and image_file.filename:
-                    if allowed_file(image_file.filename):
-                        filename = secure_filename(image_file.filename)
-                        filename = f"{user['id']}_{filename}"
-                        save_path = os.path.join(UPLOAD_FOLDER, filename)
-                        image_file.save(save_path)
-                        image_url = f"/static/uploads/{filename}"
-                    else:
-                        flash("Invalid image type. Allowed: png, jpg, jpeg, gif.")
-
-                cur.execute(
-                    """
-                    UPDATE games
-                    SET title = ?, description = ?, price = ?, image_url = ?
-                    WHERE id = ? AND seller_id = ?
-                    """,
-                    (title, description, price, image_url, game_id, user["id"])
+                    new_url, pending_image = store_game_image(image_file)
+                    image_url = new_url or image_url
+
+                (_, orphaned_spool), *versions = run_write(
+                    catalog_write,
+                    update_game,
+                    game_id, user["id"], title, description, price, image_url,
+                    pending_image
                 )
-                conn.commit()
-                conn.close()
+                remove_spool_file(orphaned_spool)
+                catalog_changed(game_id)
+                if pending_image:
+                    get_image_upload_pool().notify()
+                title_index.upsert(game_id, title)
+                title_index.applied(*versions)
                 flash("Game updated successfully.")
                 return redirect(url_for("seller_dashboard"))
 
-    conn.close()
-
     cart = get_cart()
     cart_count = cart_item_count(cart)
 
@@ -528,14 +1950,15 @@ def seller_delete_game(game_id):
     if not user:
         return redirect(url_for("index"))
 
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM games WHERE id = ? AND seller_id = ?",
-        (game_id, user["id"])
+    (deleted, orphaned_spool), *versions = run_write(
+        catalog_write, delete_game, game_id, user["id"]
     )
-    conn.commit()
-    conn.close()
+    remove_spool_file(orphaned_spool)
+
+    if deleted > 0:
+        catalog_changed(game_id)
+        title_index.remove(game_id)
+        title_index.applied(*versions)
 
     flash("Game deleted (if it existed and belonged to you).")
     return redirect(url_for("seller_dashboard"))
@@ -557,23 +1980,15 @@ def register():
             flash("Email and password are required.")
             return redirect(url_for("register"))
 
-        conn = get_connection()
-        cur = conn.cursor()
         try:
             password_hash = generate_password_hash(password)
-            cur.execute(
-                "INSERT INTO users (email, password_hash, user_type) VALUES (?, ?, ?)",
-                (email, password_hash, user_type)
-            )
-            conn.commit()
+            run_write(insert_user, email, password_hash, user_type)
             flash("Registration successful. Please log in.")
             return redirect(url_for("login"))
         except Exception as e:
             flash("Error creating user. Maybe email already exists.")
             print("Register error:", e)
             return redirect(url_for("register"))
-        finally:
-            conn.close()
 
     user = get_current_user()
     cart = get_cart()
@@ -595,17 +2010,15 @@ def login():
 
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute(
-            "SELECT * FROM users WHERE email = ?",
-            (email,)
-        )
+        cur.execute(USER_BY_EMAIL_SQL, (email,))
         user = cur.fetchone()
-        conn.close()
 
         if user and check_password_hash(user["password_hash"], password):
+            invalidate_cached_user(user["id"])
             session["user_id"] = user["id"]
             session["user_email"] = user["email"]
             session["user_type"] = user["user_type"]
+            merge_visitor_cart(user["id"])
             flash("Logged in successfully.")
 
             if user["user_type"] == "seller":
@@ -1,18 +1,805 @@
+import json
+import os
+import queue
 import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future
 
-DB_NAME = "game_store.db"
+from flask import g, has_app_context
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def get_connection():
-    """Return a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_NAME)
+# Resolved relative to this file, not the working directory of the process
+DB_NAME = os.environ.get("GAMESTORE_DB_PATH", os.path.join(BASE_DIR, "game_store.db"))
+
+# Connection tuning. Each key can be overridden with an environment variable
+# (GAMESTORE_SQLITE_<KEY>) or through app.config (SQLITE_<KEY>) in init_app().
+SQLITE_DEFAULTS = {
+    "JOURNAL_MODE": "WAL",
+    "SYNCHRONOUS": "NORMAL",
+    "BUSY_TIMEOUT_MS": 5000,
+    "MMAP_SIZE": 256 * 1024 * 1024,
+    "CACHE_SIZE_KB": 16 * 1024,
+    "CACHED_STATEMENTS": 256,
+}
+
+SQLITE_SETTINGS = {
+    key: type(default)(os.environ.get(f"GAMESTORE_SQLITE_{key}", default))
+    for key, default in SQLITE_DEFAULTS.items()
+}
+
+# Writer thread: max write units per group commit, and how long a caller
+# waits for its unit before giving up
+WRITER_MAX_BATCH = int(os.environ.get("GAMESTORE_WRITER_MAX_BATCH", 64))
+WRITER_TIMEOUT_SECONDS = float(os.environ.get("GAMESTORE_WRITER_TIMEOUT_SECONDS", 30))
+
+_thread_local = threading.local()
+
+# Callables called as listener(sql, seconds) after every statement run on
+# a connection from connect(); used for metrics. The time covers execute(),
+# i.e. preparing the statement and stepping to the first row.
+query_listeners = []
+
+# Callables called as listener(count) with the number of rows fetched from a
+# cursor (fetchone / fetchmany / fetchall; iterating a cursor is not counted).
+row_listeners = []
+
+# Callables called as hook(conn) on every new connection from connect(),
+# e.g. to install a trace callback.
+connection_hooks = []
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if not query_listeners:
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _report_query(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not query_listeners:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _report_query(sql, time.perf_counter() - start)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row_listeners and row is not None:
+            _report_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if row_listeners:
+            _report_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if row_listeners:
+            _report_rows(len(rows))
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements (direct or via cursors) reach query_listeners."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _report_query(sql, seconds):
+    for listener in query_listeners:
+        listener(sql, seconds)
+
+
+def _report_rows(count):
+    for listener in row_listeners:
+        listener(count)
+
+
+def connect():
+    """
+    Open a new, tuned connection to the SQLite database.
+
+    Most code should use get_connection() instead, which reuses one
+    connection per request (or per thread outside of Flask).
+    """
+    settings = SQLITE_SETTINGS
+    conn = sqlite3.connect(
+        DB_NAME,
+        timeout=settings["BUSY_TIMEOUT_MS"] / 1000,
+        cached_statements=settings["CACHED_STATEMENTS"],
+        factory=InstrumentedConnection,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode = {settings['JOURNAL_MODE']}")
+    conn.execute(f"PRAGMA synchronous = {settings['SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['BUSY_TIMEOUT_MS'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['MMAP_SIZE'])}")
+    # negative cache_size is in KiB rather than pages
+    conn.execute(f"PRAGMA cache_size = -{int(settings['CACHE_SIZE_KB'])}")
+    for hook in connection_hooks:
+        hook(conn)
     return conn
 
 
+def get_connection():
+    """
+    Return the SQLite connection for the current request.
+
+    The connection is stored on flask.g and closed by close_connection()
+    when the app context is torn down, so views must not close it
+    themselves. Outside of an app context (scripts, background threads)
+    one connection per thread is reused instead.
+    """
+    if has_app_context():
+        conn = g.get("_db_conn")
+        if conn is None:
+            conn = g._db_conn = connect()
+        return conn
+
+    conn = getattr(_thread_local, "conn", None)
+    if conn is None:
+        conn = _thread_local.conn = connect()
+    return conn
+
+
+def close_connection(exc=None):
+    """Teardown handler: roll back anything uncommitted and close the connection."""
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.close()
+
+
+def init_app(app):
+    """
+    Apply SQLITE_* settings from app.config and register the teardown handler.
+    """
+    global DB_NAME
+
+    DB_NAME = app.config.setdefault("SQLITE_PATH", DB_NAME)
+    for key, value in SQLITE_SETTINGS.items():
+        SQLITE_SETTINGS[key] = app.config.setdefault(f"SQLITE_{key}", value)
+
+    app.teardown_appcontext(close_connection)
+
+
+class WriteQueue:
+    """
+    Single writer thread that applies queued write units with group commit.
+
+    A write unit is a callable taking the writer's connection (plus any
+    arguments) and returning a result such as cur.lastrowid. Whatever is
+    queued when the writer wakes up is applied inside ONE transaction,
+    so concurrent checkouts share a single commit / fsync instead of each
+    fighting for the write lock. Every unit runs in its own SAVEPOINT, so
+    a failing unit is rolled back and its exception returned to its caller
+    without affecting the other units in the batch.
+    """
+
+    def __init__(self, max_batch: int = 64):
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="sqlite-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, unit, *args, **kwargs) -> Future:
+        """Queue a write unit and return a Future for its result."""
+        future = Future()
+        self._queue.put((future, unit, args, kwargs))
+        return future
+
+    def _run(self):
+        conn = connect()
+        # transactions are managed explicitly below
+        conn.isolation_level = None
+
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(conn, batch)
+
+    def _apply(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for future, unit, args, kwargs in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT write_unit")
+                try:
+                    result = unit(conn, *args, **kwargs)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_unit")
+                    conn.execute("RELEASE write_unit")
+                    results.append((future, None, e))
+                else:
+                    conn.execute("RELEASE write_unit")
+                    results.append((future, result, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # BEGIN or COMMIT failed: nothing in this batch was persisted
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> WriteQueue:
+    """
+    Return this process's writer, starting it on first use.
+
+    The pid check restarts the writer in children of a pre-forking server,
+    since the parent's thread does not survive fork().
+    """
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer_pid != os.getpid():
+                _writer = WriteQueue(max_batch=WRITER_MAX_BATCH)
+                _writer_pid = os.getpid()
+    return _writer
+
+
+def run_write(unit, *args, **kwargs):
+    """
+    Run a write unit on the writer thread and wait for its result.
+
+    Exceptions raised by the unit (e.g. sqlite3.IntegrityError) are
+    re-raised in the caller.
+    """
+    future = get_writer().submit(unit, *args, **kwargs)
+    return future.result(timeout=WRITER_TIMEOUT_SECONDS)
+
+
+# Write units, executed by the writer thread via run_write()
+
+def insert_order(conn, user_id, total, created_at, status, items, events=()):
+    """
+    Insert an order and its items; returns the new order id.
+
+    items: iterable of (game_id, quantity, price_each) tuples.
+    events: iterable of (destination, payload) outbox events, written in the
+    same transaction; "order_id" is added to each payload.
+    """
+    cur = conn.execute(
+        "INSERT INTO orders (user_id, total_amount, created_at, status) "
+        "VALUES (?, ?, ?, ?)",
+        (user_id, total, created_at, status)
+    )
+    order_id = cur.lastrowid
+    conn.executemany(
+        """
+        INSERT INTO order_items (order_id, game_id, quantity, price_each)
+        VALUES (?, ?, ?, ?)
+        """,
+        [(order_id, game_id, quantity, price_each) for game_id, quantity, price_each in items]
+    )
+    for destination, payload in events:
+        insert_outbox_event(conn, destination, dict(payload, order_id=order_id))
+    return order_id
+
+
+class StaleCartError(Exception):
+    """
+    Raised by place_order() when the cart no longer matches the catalog.
+
+    `current` maps each cart game id that still exists to its current
+    (title, price); ids missing from it were deleted.
+    """
+
+    def __init__(self, current):
+        super().__init__("Cart is out of date with the catalog.")
+        self.current = current
+
+
+def cart_games_sql(count: int) -> str:
+    placeholders = ",".join("?" for _ in range(count))
+    return f"SELECT id, title, price FROM games WHERE id IN ({placeholders})"
+
+
+def place_order(conn, user_id, created_at, status, cart, events_fn=None, cart_id=None):
+    """
+    Revalidate a cart against the games table and insert it as an order.
+
+    cart: {game_id: (quantity, price the buyer was shown)}; the caller
+    must pass the price from the page the buyer confirmed (not the current
+    catalog price), or a change in between is charged without notice.
+    events_fn(items, total), if given, returns the outbox events to write.
+    cart_id, if given, is the stored cart to empty along with the order.
+
+    Runs as one write unit, so the price check and the insert see the same
+    snapshot: one IN (...) query for every line, one order insert and one
+    executemany for the items, however large the cart. Raises StaleCartError
+    (writing nothing) if a game was deleted or its price changed.
+
+    Returns (order_id, total, items); items are dicts with game_id, title,
+    quantity and price, priced from the database.
+    """
+    game_ids = list(cart)
+    rows = conn.execute(cart_games_sql(len(game_ids)), game_ids).fetchall()
+    current = {row["id"]: (row["title"], row["price"]) for row in rows}
+
+    stale = len(current) != len(game_ids) or any(
+        round(current[game_id][1], 2) != round(expected_price, 2)
+        for game_id, (_, expected_price) in cart.items()
+    )
+    if stale:
+        raise StaleCartError(current)
+
+    items = [
+        {
+            "game_id": game_id,
+            "title": current[game_id][0],
+            "quantity": int(quantity),
+            "price": float(current[game_id][1]),
+        }
+        for game_id, (quantity, _) in cart.items()
+    ]
+    total = round(sum(item["price"] * item["quantity"] for item in items), 2)
+
+    order_id = insert_order(
+        conn,
+        user_id,
+        total,
+        created_at,
+        status,
+        [(item["game_id"], item["quantity"], item["price"]) for item in items],
+        events_fn(items, total) if events_fn else (),
+    )
+    if cart_id is not None:
+        cart_remove_items(conn, cart_id)
+    return order_id, total, items
+
+
+def insert_outbox_event(conn, destination, payload):
+    """Queue an event for the outbox dispatcher; payload must be JSON-serializable."""
+    cur = conn.execute(
+        "INSERT INTO outbox (destination, payload) VALUES (?, ?)",
+        (destination, json.dumps(payload))
+    )
+    return cur.lastrowid
+
+
+OUTBOX_CLAIM_SQL = """
+    SELECT id, destination, payload, attempts
+    FROM outbox
+    WHERE status = 'pending' AND next_attempt_at <= ?
+    ORDER BY next_attempt_at, id
+    LIMIT ?
+"""
+
+
+def claim_outbox_events(conn, limit, lease_seconds):
+    """
+    Return up to `limit` due pending events and lease them for `lease_seconds`.
+
+    Leased events are invisible to other dispatchers until the lease runs
+    out, so an event whose dispatcher dies mid-send is picked up again.
+    """
+    now = time.time()
+    rows = conn.execute(OUTBOX_CLAIM_SQL, (now, limit)).fetchall()
+    conn.executemany(
+        "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+        [(now + lease_seconds, row["id"]) for row in rows]
+    )
+    return rows
+
+
+def mark_outbox_delivered(conn, event_ids):
+    conn.executemany(
+        """
+        UPDATE outbox
+        SET status = 'delivered', delivered_at = CURRENT_TIMESTAMP, last_error = NULL
+        WHERE id = ?
+        """,
+        [(event_id,) for event_id in event_ids]
+    )
+
+
+OUTBOX_PURGE_SQL = """
+    DELETE FROM outbox
+    WHERE status = 'delivered' AND delivered_at < datetime('now', ?)
+"""
+
+
+def purge_delivered_outbox(conn, max_age_seconds):
+    """Delete events delivered more than max_age_seconds ago; returns how many."""
+    cur = conn.execute(OUTBOX_PURGE_SQL, (f"-{int(max_age_seconds)} seconds",))
+    return cur.rowcount
+
+
+def reschedule_outbox_events(conn, failures):
+    """
+    Record failed delivery attempts.
+
+    failures: iterable of (event_id, attempts, next_attempt_at, status, error);
+    status is 'pending' to retry at next_attempt_at or 'failed' to give up.
+    """
+    conn.executemany(
+        """
+        UPDATE outbox
+        SET attempts = ?, next_attempt_at = ?, status = ?, last_error = ?
+        WHERE id = ?
+        """,
+        [
+            (attempts, next_attempt_at, status, error, event_id)
+            for event_id, attempts, next_attempt_at, status, error in failures
+        ]
+    )
+
+
+def apply_order_events(conn, updates):
+    """
+    Move orders on from PLACED; updates: iterable of (order_id, status).
+
+    Orders already past PLACED are left alone, so redelivered or duplicate
+    events are no-ops. Returns the number of orders changed.
+    """
+    cur = conn.executemany(
+        "UPDATE orders SET status = ? WHERE id = ? AND status = 'PLACED'",
+        [(status, order_id) for order_id, status in updates]
+    )
+    return cur.rowcount
+
+
+CART_ITEMS_SQL = "SELECT game_id, quantity FROM cart_items WHERE cart_id = ?"
+
+
+def load_cart_items(conn, cart_id) -> dict:
+    """Return {game_id: quantity} for a cart (empty if it does not exist)."""
+    return {row["game_id"]: row["quantity"] for row in conn.execute(CART_ITEMS_SQL, (cart_id,)).fetchall()}
+
+
+def _touch_cart(conn, cart_id, user_id):
+    conn.execute(
+        """
+        INSERT INTO carts (id, user_id, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at
+        """,
+        (cart_id, user_id, time.time())
+    )
+
+
+def cart_add_item(conn, cart_id, user_id, game_id, quantity=1):
+    """Add quantity of a game to a cart, creating the cart if needed."""
+    _touch_cart(conn, cart_id, user_id)
+    conn.execute(
+        """
+        INSERT INTO cart_items (cart_id, game_id, quantity) VALUES (?, ?, ?)
+        ON CONFLICT (cart_id, game_id) DO UPDATE SET quantity = quantity + excluded.quantity
+        """,
+        (cart_id, game_id, quantity)
+    )
+
+
+def cart_set_quantity(conn, cart_id, user_id, game_id, quantity):
+    """Set the quantity of a game in a cart; 0 removes the line."""
+    if quantity <= 0:
+        cart_remove_items(conn, cart_id, [game_id])
+        return
+    _touch_cart(conn, cart_id, user_id)
+    conn.execute(
+        """
+        INSERT INTO cart_items (cart_id, game_id, quantity) VALUES (?, ?, ?)
+        ON CONFLICT (cart_id, game_id) DO UPDATE SET quantity = excluded.quantity
+        """,
+        (cart_id, game_id, quantity)
+    )
+
+
+def cart_change_once(conn, scope, cart_id, idempotency_key, unit, *args):
+    """
+    Run a cart write unit, at most once per idempotency key.
+
+    Keys are scoped to their caller (`scope`: the user's cart id, or a
+    token kept in an anonymous visitor's session), so replaying someone
+    else's key neither skips a change nor reveals their cart. Returns
+    (cart_id, applied). A repeated key is a no-op and returns the cart the
+    first request changed, so a retried request from the same caller that
+    raced its original (e.g. before the cart cookie arrived) can adopt that
+    cart.
+    """
+    if idempotency_key is not None:
+        row = conn.execute(
+            "SELECT cart_id FROM cart_requests WHERE scope = ? AND idempotency_key = ?",
+            (scope, idempotency_key)
+        ).fetchone()
+        if row is not None:
+            return row["cart_id"], False
+        conn.execute(
+            """
+            INSERT INTO cart_requests (scope, idempotency_key, cart_id, created_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (scope, idempotency_key, cart_id, time.time())
+        )
+    unit(conn, cart_id, *args)
+    return cart_id, True
+
+
+def cart_remove_items(conn, cart_id, game_ids=None):
+    """Remove the given games from a cart, or every line if game_ids is None."""
+    if game_ids is None:
+        conn.execute("DELETE FROM cart_items WHERE cart_id = ?", (cart_id,))
+    else:
+        conn.executemany(
+            "DELETE FROM cart_items WHERE cart_id = ? AND game_id = ?",
+            [(cart_id, game_id) for game_id in game_ids]
+        )
+    conn.execute("UPDATE carts SET updated_at = ? WHERE id = ?", (time.time(), cart_id))
+
+
+def merge_carts(conn, from_cart_id, to_cart_id, user_id):
+    """
+    Move every line of from_cart_id into to_cart_id (adding quantities for
+    games in both) and delete from_cart_id. Used when a visitor logs in;
+    only anonymous carts are merged, never another user's cart.
+    """
+    owner = conn.execute("SELECT user_id FROM carts WHERE id = ?", (from_cart_id,)).fetchone()
+    if owner is None or owner["user_id"] is not None:
+        return
+    _touch_cart(conn, to_cart_id, user_id)
+    conn.execute(
+        """
+        INSERT INTO cart_items (cart_id, game_id, quantity)
+        SELECT ?, game_id, quantity FROM cart_items WHERE cart_id = ?
+        ON CONFLICT (cart_id, game_id) DO UPDATE SET quantity = quantity + excluded.quantity
+        """,
+        (to_cart_id, from_cart_id)
+    )
+    conn.execute("DELETE FROM cart_items WHERE cart_id = ?", (from_cart_id,))
+    conn.execute("DELETE FROM carts WHERE id = ?", (from_cart_id,))
+
+
+CART_REQUEST_TTL_SECONDS = 24 * 60 * 60
+
+
+def expire_carts(conn, max_age_seconds):
+    """
+    Delete anonymous carts untouched for max_age_seconds, and idempotency
+    keys older than a day; returns how many carts were deleted.
+    """
+    conn.execute(
+        "DELETE FROM cart_requests WHERE created_at < ?",
+        (time.time() - CART_REQUEST_TTL_SECONDS,)
+    )
+    cutoff = time.time() - max_age_seconds
+    conn.execute(
+        """
+        DELETE FROM cart_items WHERE cart_id IN (
+            SELECT id FROM carts WHERE user_id IS NULL AND updated_at < ?
+        )
+        """,
+        (cutoff,)
+    )
+    cur = conn.execute(
+        "DELETE FROM carts WHERE user_id IS NULL AND updated_at < ?", (cutoff,)
+    )
+    return cur.rowcount
+
+
+def insert_game(conn, title, description, price, image_url, seller_id,
+                pending_image=None):
+    """
+    Insert a game listing; returns the new game id.
+
+    pending_image: optional (image_key, spool_path) queued in the same
+    transaction for the background image upload pool.
+    """
+    cur = conn.execute(
+        """
+        INSERT INTO games (title, description, price, image_url, seller_id, updated_at)
+        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """,
+        (title, description, price, image_url, seller_id)
+    )
+    game_id = cur.lastrowid
+    if pending_image:
+        queue_image_upload(conn, game_id, *pending_image)
+    return game_id
+
+
+def update_game(conn, game_id, seller_id, title, description, price, image_url,
+                pending_image=None):
+    """
+    Update a seller's game listing; returns (rows changed, spool path of a
+    replaced pending image that nothing else uses, or None).
+    """
+    cur = conn.execute(
+        """
+        UPDATE games
+        SET title = ?, description = ?, price = ?, image_url = ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND seller_id = ?
+        """,
+        (title, description, price, image_url, game_id, seller_id)
+    )
+    orphaned_spool = None
+    if pending_image and cur.rowcount:
+        orphaned_spool = queue_image_upload(conn, game_id, *pending_image)
+    return cur.rowcount, orphaned_spool
+
+
+def delete_game(conn, game_id, seller_id):
+    """
+    Delete a seller's game listing; returns (rows deleted, spool path of its
+    pending image if nothing else uses it, or None).
+    """
+    cur = conn.execute(
+        "DELETE FROM games WHERE id = ? AND seller_id = ?",
+        (game_id, seller_id)
+    )
+    orphaned_spool = None
+    if cur.rowcount:
+        pending = _pending_image_upload(conn, game_id)
+        conn.execute("DELETE FROM image_uploads WHERE game_id = ?", (game_id,))
+        orphaned_spool = _unused_spool_path(conn, pending)
+    return cur.rowcount, orphaned_spool
+
+
+def _pending_image_upload(conn, game_id):
+    return conn.execute(
+        "SELECT image_key, spool_path FROM image_uploads WHERE game_id = ?",
+        (game_id,)
+    ).fetchone()
+
+
+def _unused_spool_path(conn, upload):
+    """The spool path of a dropped upload row, unless another upload uses the same image."""
+    if upload is None:
+        return None
+    remaining = conn.execute(
+        "SELECT COUNT(*) FROM image_uploads WHERE image_key = ?", (upload["image_key"],)
+    ).fetchone()[0]
+    return None if remaining else upload["spool_path"]
+
+
+def queue_image_upload(conn, game_id, image_key, spool_path):
+    """
+    Record a spooled image waiting to be uploaded for a game. A newer
+    upload for the same game replaces an older one that is still pending;
+    returns the replaced upload's spool path if nothing else uses it (the
+    caller removes the file after the commit), else None.
+    """
+    pending = _pending_image_upload(conn, game_id)
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO image_uploads (game_id, image_key, spool_path)
+        VALUES (?, ?, ?)
+        """,
+        (game_id, image_key, spool_path)
+    )
+    if pending is None or pending["image_key"] == image_key:
+        return None
+    return _unused_spool_path(conn, pending)
+
+
+IMAGE_UPLOAD_CLAIM_SQL = """
+    SELECT game_id, image_key, spool_path, attempts
+    FROM image_uploads
+    WHERE status = 'pending' AND next_attempt_at <= ?
+    ORDER BY next_attempt_at
+    LIMIT ?
+"""
+
+
+def claim_image_uploads(conn, limit, lease_seconds):
+    """Return up to `limit` due pending uploads, leased like outbox events."""
+    now = time.time()
+    rows = conn.execute(IMAGE_UPLOAD_CLAIM_SQL, (now, limit)).fetchall()
+    conn.executemany(
+        "UPDATE image_uploads SET next_attempt_at = ? WHERE game_id = ?",
+        [(now + lease_seconds, row["game_id"]) for row in rows]
+    )
+    return rows
+
+
+def complete_image_upload(conn, game_id, image_key, image_url):
+    """
+    Point the game at its uploaded image and drop the pending upload.
+
+    Nothing changes if the upload was replaced by a newer one or the game
+    was deleted meanwhile. Returns (games updated, pending uploads that
+    still use image_key); the spool file can go once the latter is 0.
+    """
+    cur = conn.execute(
+        "DELETE FROM image_uploads WHERE game_id = ? AND image_key = ?",
+        (game_id, image_key)
+    )
+    updated = 0
+    if cur.rowcount:
+        updated = conn.execute(
+            """
+            UPDATE games SET image_url = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (image_url, game_id)
+        ).rowcount
+    remaining = conn.execute(
+        "SELECT COUNT(*) FROM image_uploads WHERE image_key = ?", (image_key,)
+    ).fetchone()[0]
+    return updated, remaining
+
+
+def reschedule_image_uploads(conn, failures):
+    """
+    Record failed upload attempts.
+
+    failures: iterable of (game_id, image_key, attempts, next_attempt_at,
+    status, error); status is 'pending' to retry or 'failed' to give up.
+    """
+    conn.executemany(
+        """
+        UPDATE image_uploads
+        SET attempts = ?, next_attempt_at = ?, status = ?, last_error = ?
+        WHERE game_id = ? AND image_key = ?
+        """,
+        [
+            (attempts, next_attempt_at, status, error, game_id, image_key)
+            for game_id, image_key, attempts, next_attempt_at, status, error in failures
+        ]
+    )
+
+
+def insert_user(conn, email, password_hash, user_type):
+    """Insert a user; returns the new user id."""
+    cur = conn.execute(
+        "INSERT INTO users (email, password_hash, user_type) VALUES (?, ?, ?)",
+        (email, password_hash, user_type)
+    )
+    return cur.lastrowid
+
+
 def init_db():
-    """Create tables if they do not exist."""
-    conn = get_connection()
+    """
+    Create tables if they do not exist and apply pending migrations.
+
+    When user_version already matches SCHEMA_VERSION this is a single
+    PRAGMA read, so booting a worker against a current database skips
+    all of the DDL.
+    """
+    conn = connect()
+    if get_schema_version(conn) >= SCHEMA_VERSION:
+        conn.close()
+        return
+
     cur = conn.cursor()
 
     # Users table
@@ -66,6 +853,370 @@ def init_db():
         )
     """)
 
+    conn.commit()
+
+    migrate(conn)
+    conn.close()
+
+
+# SCHEMA MIGRATIONS
+# Each migration runs exactly once, in order, inside its own transaction;
+# the last applied version is stored in PRAGMA user_version. Append new
+# migrations to MIGRATIONS, never edit one that has already shipped.
+
+def _migration_catalog_indexes(cur):
+    # Storefront catalog indexes
+    # Each one backs a keyset-paginated sort order on the index page;
+    # the trailing id column is the tie-breaker used by the cursor.
+    # idx_games_seller also serves the seller dashboard.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_games_price ON games (price, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_games_title ON games (title, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_games_seller ON games (seller_id, id)")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_games_seller_price ON games (seller_id, price, id)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_games_seller_title ON games (seller_id, title, id)"
+    )
+
+
+def _migration_games_fts(cur):
+    # Full-text search index over games (external content table)
+    # Kept in sync by triggers, so the seller add / edit / delete routes
+    # do not need to touch it directly.
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS games_fts USING fts5(
+            title,
+            description,
+            content='games',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    """)
+
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS games_fts_ai AFTER INSERT ON games BEGIN
+            INSERT INTO games_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+    """)
+
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS games_fts_ad AFTER DELETE ON games BEGIN
+            INSERT INTO games_fts (games_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+        END
+    """)
+
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS games_fts_au AFTER UPDATE OF title, description ON games BEGIN
+            INSERT INTO games_fts (games_fts, rowid, title, description)
+            VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO games_fts (rowid, title, description)
+            VALUES (new.id, new.title, new.description);
+        END
+    """)
+
+    # Existing databases already have games that the triggers never saw
+    cur.execute("INSERT INTO games_fts (games_fts) VALUES ('rebuild')")
+
+
+def _migration_order_indexes(cur):
+    # My Orders: WHERE user_id = ? ORDER BY created_at DESC
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at)"
+    )
+    # Order items join in My Orders, and popularity per game
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_order_items_game ON order_items (game_id)"
+    )
+
+
+def _migration_catalog_version(cur):
+    # Single-row counter bumped by every write to games, in any process.
+    # Lets per-process caches detect that the catalog changed with one
+    # primary-key lookup.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    cur.execute("INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 0)")
+
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS games_version_{event.lower()} AFTER {event} ON games BEGIN
+                UPDATE catalog_meta SET version = version + 1 WHERE id = 1;
+            END
+        """)
+
+
+def _migration_updated_at(cur):
+    # Modification timestamps for conditional GET (ETag / Last-Modified).
+    # games.updated_at is set by the add / edit write units; the catalog-wide
+    # timestamp also moves on deletes, via the version triggers.
+    cur.execute("ALTER TABLE games ADD COLUMN updated_at TEXT")
+    cur.execute("UPDATE games SET updated_at = CURRENT_TIMESTAMP")
+    cur.execute("ALTER TABLE catalog_meta ADD COLUMN updated_at TEXT")
+    cur.execute("UPDATE catalog_meta SET updated_at = CURRENT_TIMESTAMP")
+
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(f"DROP TRIGGER IF EXISTS games_version_{event.lower()}")
+        cur.execute(f"""
+            CREATE TRIGGER games_version_{event.lower()} AFTER {event} ON games BEGIN
+                UPDATE catalog_meta
+                SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = 1;
+            END
+        """)
+
+
+def _migration_outbox(cur):
+    # Transactional outbox: order events are written in the checkout
+    # transaction and delivered to SQS / SNS by a background dispatcher.
+    # next_attempt_at is a unix timestamp (retry backoff and claim leases).
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            destination TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            delivered_at TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox(next_attempt_at, id) WHERE status = 'pending'
+    """)
+
+
+def _migration_carts(cur):
+    # Server-side carts. The browser only holds an opaque cart id; logged-in
+    # users' carts have user_id set and never expire. updated_at is a unix
+    # timestamp used to expire abandoned anonymous carts.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS carts (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER UNIQUE,
+            updated_at REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_carts_anonymous_updated
+        ON carts(updated_at) WHERE user_id IS NULL
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS cart_items (
+            cart_id TEXT NOT NULL,
+            game_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK (quantity > 0),
+            PRIMARY KEY (cart_id, game_id)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migration_cart_requests(cur):
+    # Idempotency keys of JSON cart API requests, so retried or
+    # double-submitted changes are applied once. Purged after a day.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS cart_requests (
+            idempotency_key TEXT PRIMARY KEY,
+            cart_id TEXT NOT NULL,
+            created_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cart_requests_created
+        ON cart_requests(created_at)
+    """)
+
+
+def _migration_order_history_keyset(cur):
+    # My Orders pages with a (created_at, id) cursor; the id column lets the
+    # index return ties in cursor order, so it replaces the older index.
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_orders_user_created_id
+        ON orders (user_id, created_at, id)
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_orders_user_created")
+
+
+def _migration_image_uploads(cur):
+    # Game images waiting in the local spool for the background S3 upload
+    # pool; one row per game, deleted once the game points at the upload.
+    # next_attempt_at is a unix timestamp (retry backoff and claim leases).
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS image_uploads (
+            game_id INTEGER PRIMARY KEY,
+            image_key TEXT NOT NULL,
+            spool_path TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_image_uploads_pending
+        ON image_uploads(next_attempt_at) WHERE status = 'pending'
+    """)
+
+
+def _migration_cart_request_scopes(cur):
+    # Idempotency keys are scoped to the user or visitor session that sent
+    # them. Keys only live for a day, so the old global ones are dropped.
+    cur.execute("DROP TABLE IF EXISTS cart_requests")
+    cur.execute("""
+        CREATE TABLE cart_requests (
+            scope TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            cart_id TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (scope, idempotency_key)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_cart_requests_created
+        ON cart_requests(created_at)
+    """)
+
+
+def _migration_outbox_retention(cur):
+    # Delivered events are purged once they are older than the retention
+    # window; the partial index keeps that from scanning pending events.
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_delivered
+        ON outbox(delivered_at) WHERE status = 'delivered'
+    """)
+
+
+MIGRATIONS = [
+    (1, _migration_catalog_indexes),
+    (2, _migration_games_fts),
+    (3, _migration_order_indexes),
+    (4, _migration_catalog_version),
+    (5, _migration_updated_at),
+    (6, _migration_outbox),
+    (7, _migration_carts),
+    (8, _migration_cart_requests),
+    (9, _migration_order_history_keyset),
+    (10, _migration_image_uploads),
+    (11, _migration_cart_request_scopes),
+    (12, _migration_outbox_retention),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+CATALOG_VERSION_SQL = "SELECT version FROM catalog_meta WHERE id = 1"
+
+
+def get_catalog_version(conn) -> int:
+    """Return the catalog version counter (changes on every games write)."""
+    return conn.execute(CATALOG_VERSION_SQL).fetchone()[0]
+
+
+def catalog_write(conn, unit, *args):
+    """
+    Run a write unit that changes games; returns (result, catalog version
+    before, catalog version after), read in the same transaction so the
+    caller knows exactly which version bumps its own write caused.
+    """
+    before = get_catalog_version(conn)
+    result = unit(conn, *args)
+    return result, before, get_catalog_version(conn)
+
+
+def get_schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Apply every migration newer than the database's user_version.
+
+    Each migration and its version bump commit together, and the version is
+    re-read under the write lock, so concurrently booting workers apply each
+    migration exactly once. Returns the list of versions applied.
+    """
+    applied = []
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, migration in MIGRATIONS:
+            if get_schema_version(conn) >= version:
+                continue
+
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                if get_schema_version(conn) >= version:
+                    cur.execute("ROLLBACK")
+                    continue
+                migration(cur)
+                cur.execute(f"PRAGMA user_version = {int(version)}")
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            applied.append(version)
+    finally:
+        conn.isolation_level = isolation_level
+
+    return applied
+
+
+def find_plan_problems(conn, query, params=(), bounded=False, allow_sort=False) -> list:
+    """
+    Run EXPLAIN QUERY PLAN for a query and return the steps that are too slow
+    for a hot path: full table scans and temporary B-tree sorts.
+
+    bounded=True accepts SCAN steps, for LIMIT queries that walk a table or
+    index in the requested order and stop early (keyset first pages).
+    allow_sort=True accepts temp B-tree sorts (e.g. ranking FTS matches).
+    FTS5 virtual table lookups are never reported, nor are scans of a CTE's
+    result: the steps that build the CTE are checked on their own.
+    """
+    cur = conn.execute("EXPLAIN QUERY PLAN " + query, params)
+    problems = []
+    ctes = set()
+    for row in cur.fetchall():
+        detail = row[3]
+        if detail.startswith(("CO-ROUTINE ", "MATERIALIZE ")):
+            ctes.add(detail.split(" ", 1)[1])
+            continue
+        words = detail.split(" ")
+        if "VIRTUAL TABLE" in detail or (words[0] == "SCAN" and words[1] in ctes):
+            continue
+        if detail.startswith("SCAN ") and not bounded:
+            problems.append(detail)
+        elif detail.startswith("USE TEMP B-TREE") and not allow_sort:
+            problems.append(detail)
+    return problems
+
+
+def rebuild_search_index():
+    """
+    Rebuild the games full-text index from the games table.
+
+    Only needed if the index has drifted (e.g. rows were changed with the
+    triggers dropped); normal writes keep it in sync incrementally.
+    """
+    conn = connect()
+    migrate(conn)
+    conn.execute("INSERT INTO games_fts (games_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO games_fts (games_fts) VALUES ('optimize')")
     conn.commit()
     conn.close()
 
@@ -81,6 +1232,12 @@ def seed_sample_games():
 
 
 if __name__ == "__main__":
+    if sys.argv[1:] == ["rebuild-search"]:
+        print("Rebuilding search index...")
+        rebuild_search_index()
+        print("Search index rebuilt.")
+        sys.exit(0)
+
     print("Initializing database...")
     init_db()
     seed_sample_games()
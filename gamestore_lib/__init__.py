@@ -12,11 +12,63 @@ Example:
 """
 
 # Expose cart helper functions
-from .cart_utils import calculate_cart_total, cart_item_count
+from .cart_utils import calculate_cart_total, cart_item_count, cart_lines
 
 # Expose currency formatting helpers
 from .currency import format_eur
 
-from .storage_s3 import upload_game_image
+# Expose keyset pagination cursor helpers
+from .pagination import encode_cursor, decode_cursor, is_sqlite_int
 
-from .aws_events import send_order_event_to_sqs, notify_order_via_sns
\ No newline at end of file
+# Expose full-text search helpers
+from .search import build_fts_query, highlight_markup, HIGHLIGHT_START, HIGHLIGHT_END
+
+# Expose the in-memory title autocomplete index
+from .autocomplete import TitleIndex, fold_text
+
+# Expose the generic in-process LRU / TTL cache
+from .lru_cache import LRUCache
+
+# Expose the shared game record cache
+from .catalog_cache import GameRecord, GameCache, CatalogVersion
+
+# Expose the compressed full-page response cache
+from .response_cache import ResponseCache
+
+# Expose conditional GET helpers
+from .http_cache import make_etag, parse_sqlite_timestamp
+
+# Expose content-hashed static asset URLs
+from .assets import AssetManifest
+
+# Expose response compression helpers
+from .compression import is_compressible, gzip_sibling, precompress_files
+
+# Expose the in-process metrics registry (Prometheus text format)
+from .metrics import MetricsRegistry, metrics
+
+# Expose SQL tracing, slow-query logging and query count assertions
+from .sql_trace import SQLTracer, QueryTrace, TracedQuery, normalize_sql, assert_max_queries
+
+# Expose the shared, pooled boto3 client registry
+from .aws_clients import ClientRegistry, clients, get_client, build_client_config, aws_errors
+
+# Expose the content-addressed image stores
+from .image_store import LocalImageStore, StoredImage, image_extension, is_image_key
+from .image_store import IMAGE_CACHE_CONTROL
+
+from .storage_s3 import upload_game_image, S3ImageStore, build_transfer_config
+
+# Expose the background image upload pool
+from .image_uploads import ImageUploadPool
+
+from .aws_events import send_order_event_to_sqs, notify_order_via_sns
+from .aws_events import build_order_event, build_order_notification, OutboxDispatcher
+from .aws_events import SQSTransport
+
+# Expose the local order event transports
+from .transports import ConsumedMessage, InProcessTransport, SQLiteQueueTransport
+from .transports import create_transport, TRANSPORTS
+
+# Expose the long-running order event consumer
+from .event_consumer import EventConsumer, order_event_updates
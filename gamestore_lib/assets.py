@@ -0,0 +1,50 @@
+import hashlib
+import os
+import threading
+
+
+class AssetManifest:
+    """
+    Content-hashed URLs for static assets (stylesheets, scripts).
+
+    asset_url("css/base.css") returns "<url_prefix>/<digest>/css/base.css",
+    where digest is a short hash of the file contents, so the URL changes
+    whenever the file does and responses can be cached as immutable.
+    Digests are computed once per file; with `auto_reload` the file mtime
+    is checked on every call so edits show up without a restart.
+    """
+
+    def __init__(self, static_folder: str, url_prefix: str = "/assets",
+                 auto_reload: bool = False):
+        self.static_folder = static_folder
+        self.url_prefix = url_prefix.rstrip("/")
+        self.auto_reload = auto_reload
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path: str) -> str:
+        full_path = os.path.join(self.static_folder, path)
+        cached = self._digests.get(path)
+        if cached is not None and not self.auto_reload:
+            return cached[1]
+
+        mtime = os.path.getmtime(full_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(full_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._digests[path] = (mtime, digest)
+        return digest
+
+    def asset_url(self, path: str) -> str:
+        path = path.lstrip("/")
+        return f"{self.url_prefix}/{self.digest(path)}/{path}"
+
+    def is_current(self, path: str, digest: str) -> bool:
+        """True if digest matches the file's current contents."""
+        try:
+            return self.digest(path) == digest
+        except OSError:
+            return False
@@ -0,0 +1,182 @@
+import heapq
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+
+def fold_text(text: str) -> str:
+    """
+    Case- and accent-fold text for matching ("Pokémon" -> "pokemon").
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return stripped.casefold()
+
+
+class TitleIndex:
+    """
+    In-process prefix index over game titles for search-as-you-type.
+
+    Every word start of every title is kept in one sorted list of
+    (folded text, game id) pairs, so a prefix lookup is a bisect plus a
+    scan of the matches instead of a database query. The index is loaded
+    lazily on first use through `loader`, which must return (titles,
+    popularity): an iterable of (game_id, title) pairs and a dict of
+    game_id -> units sold.
+
+    Every match is ranked, so the most popular titles win however many
+    share the prefix. Short prefixes (up to `short_prefix` characters)
+    match much of the catalog, so their top `top_size` results are kept
+    until the next change to the index.
+
+    `version_fn()`, if given, returns the current catalog version (e.g.
+    CatalogVersion.current). This process's writes are applied
+    incrementally (upsert / remove) and then marked with applied(), so only
+    a version the index has not accounted for, i.e. a write by another
+    process, makes it reload.
+    """
+
+    def __init__(self, loader, version_fn=None, short_prefix: int = 3, top_size: int = 20):
+        self._loader = loader
+        self._version_fn = version_fn
+        self._short_prefix = short_prefix
+        self._top_size = top_size
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._version = None
+        self._entries = []
+        self._titles = {}
+        self._popularity = {}
+        # short prefix -> ranked game ids, up to top_size
+        self._top = {}
+
+    def _keys_for(self, title: str):
+        words = fold_text(title).split()
+        return {" ".join(words[i:]) for i in range(len(words))}
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            titles, popularity = self._loader()
+            entries = []
+            names = {}
+            for game_id, title in titles:
+                names[game_id] = title
+                entries.extend((key, game_id) for key in self._keys_for(title))
+            entries.sort()
+            self._entries = entries
+            self._titles = names
+            self._popularity = dict(popularity)
+            self._top = {}
+            self._loaded = True
+
+    def _check_version(self):
+        if self._version_fn is None:
+            return
+        version = self._version_fn()
+        if version != self._version:
+            with self._lock:
+                self._version = version
+                self._loaded = False
+
+    def applied(self, before, after):
+        """
+        Record that a local write moved the catalog version from `before` to
+        `after` and its changes were applied (or change no titles). Ignored
+        if the index is not at `before`: another write came in between.
+        """
+        with self._lock:
+            if self._version == before:
+                self._version = after
+
+    def _remove_locked(self, game_id: int):
+        title = self._titles.pop(game_id, None)
+        if title is None:
+            return
+        for key in self._keys_for(title):
+            pos = bisect_left(self._entries, (key, game_id))
+            if pos < len(self._entries) and self._entries[pos] == (key, game_id):
+                del self._entries[pos]
+
+    def upsert(self, game_id: int, title: str):
+        """Add a game or replace its title after an insert / update commit."""
+        with self._lock:
+            if not self._loaded:
+                # nothing to keep in sync yet; the first lookup loads fresh data
+                return
+            self._remove_locked(game_id)
+            self._titles[game_id] = title
+            for key in self._keys_for(title):
+                insort(self._entries, (key, game_id))
+            self._top = {}
+
+    def remove(self, game_id: int):
+        """Drop a game after a delete commit."""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._remove_locked(game_id)
+            self._popularity.pop(game_id, None)
+            self._top = {}
+
+    def record_sales(self, quantities: dict):
+        """Bump popularity counters (game_id -> units) after an order commit."""
+        with self._lock:
+            if not self._loaded:
+                return
+            for game_id, quantity in quantities.items():
+                self._popularity[game_id] = self._popularity.get(game_id, 0) + quantity
+            self._top = {}
+
+    def invalidate(self):
+        """Forget everything; the next lookup reloads from the loader."""
+        with self._lock:
+            self._loaded = False
+            self._entries = []
+            self._titles = {}
+            self._popularity = {}
+            self._top = {}
+
+    def _rank_locked(self, folded: str, limit: int) -> list:
+        entries = self._entries
+        pos = bisect_left(entries, (folded,))
+        matches = set()
+        while pos < len(entries):
+            key, game_id = entries[pos]
+            if not key.startswith(folded):
+                break
+            matches.add(game_id)
+            pos += 1
+
+        popularity = self._popularity
+        titles = self._titles
+        return heapq.nsmallest(
+            limit,
+            matches,
+            key=lambda gid: (-popularity.get(gid, 0), titles[gid].casefold(), gid),
+        )
+
+    def suggest(self, prefix: str, limit: int = 8) -> list:
+        """
+        Return up to `limit` (game_id, title) pairs whose title, or any word
+        in it, starts with `prefix`, most popular first.
+        """
+        folded = " ".join(fold_text(prefix).split())
+        if not folded or limit <= 0:
+            return []
+
+        self._check_version()
+        self._ensure_loaded()
+
+        with self._lock:
+            if len(folded) <= self._short_prefix and limit <= self._top_size:
+                best = self._top.get(folded)
+                if best is None:
+                    best = self._top[folded] = self._rank_locked(folded, self._top_size)
+                best = best[:limit]
+            else:
+                best = self._rank_locked(folded, limit)
+            return [(game_id, self._titles[game_id]) for game_id in best]
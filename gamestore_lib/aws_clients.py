@@ -0,0 +1,123 @@
+import os
+import threading
+
+# boto3 / botocore are imported on first use rather than at import time:
+# loading them costs a noticeable share of worker start-up, and most
+# requests never talk to AWS.
+
+AWS_REGION = os.environ.get("AWS_REGION", "eu-west-1")
+
+# Shared client settings; each can be overridden with the environment
+# variable of the same name.
+AWS_CLIENT_DEFAULTS = {
+    "AWS_MAX_POOL_CONNECTIONS": 20,
+    "AWS_CONNECT_TIMEOUT": 2.0,
+    "AWS_READ_TIMEOUT": 10.0,
+    "AWS_RETRY_MODE": "adaptive",
+    "AWS_MAX_ATTEMPTS": 4,
+}
+
+
+def _setting(name):
+    default = AWS_CLIENT_DEFAULTS[name]
+    value = os.environ.get(name)
+    return default if value is None else type(default)(value)
+
+
+def aws_errors() -> tuple:
+    """
+    The botocore exception classes callers catch, imported lazily:
+    `except aws_errors() as e:` only evaluates this when something is raised.
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+
+    return (BotoCoreError, ClientError)
+
+
+def build_client_config(**overrides):
+    """
+    botocore Config shared by every client: a connection pool sized for the
+    worker's threads, explicit connect / read timeouts and adaptive retries.
+    Keyword arguments override individual Config options.
+    """
+    from botocore.config import Config
+
+    config = Config(
+        max_pool_connections=_setting("AWS_MAX_POOL_CONNECTIONS"),
+        connect_timeout=_setting("AWS_CONNECT_TIMEOUT"),
+        read_timeout=_setting("AWS_READ_TIMEOUT"),
+        retries={
+            "mode": _setting("AWS_RETRY_MODE"),
+            "total_max_attempts": _setting("AWS_MAX_ATTEMPTS"),
+        },
+    )
+    if overrides:
+        config = config.merge(Config(**overrides))
+    return config
+
+
+class ClientRegistry:
+    """
+    Thread-safe registry holding one boto3 client per (service, region).
+
+    boto3 clients are thread-safe but expensive to build (endpoint and model
+    loading) and each one owns its own HTTP connection pool, so they are
+    built once and reused. Clients are dropped when the process id changes,
+    since connection pools must not be shared with forked children.
+    set() installs a client (e.g. a stub in tests) in place of a real one.
+    """
+
+    def __init__(self, config_factory=build_client_config):
+        self._config_factory = config_factory
+        self._clients = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _key(self, service, region, overrides):
+        return (service, region or AWS_REGION, tuple(sorted(overrides.items())))
+
+    def get(self, service: str, region: str = None, **overrides):
+        """
+        Return the shared client for service / region; keyword arguments are
+        botocore Config overrides (e.g. read_timeout for long polling) and
+        get a client of their own.
+        """
+        key = self._key(service, region, overrides)
+        if self._pid == os.getpid():
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients.clear()
+                self._pid = os.getpid()
+            client = self._clients.get(key)
+            if client is None:
+                import boto3
+
+                client = boto3.session.Session().client(
+                    service,
+                    region_name=key[1],
+                    config=self._config_factory(**overrides),
+                )
+                self._clients[key] = client
+            return client
+
+    def set(self, service: str, client, region: str = None, **overrides):
+        with self._lock:
+            self._clients[self._key(service, region, overrides)] = client
+
+    def reset(self):
+        """Drop every client; the next get() builds fresh ones."""
+        with self._lock:
+            self._clients.clear()
+            self._pid = os.getpid()
+
+
+# Process-wide registry used by aws_events and storage_s3
+clients = ClientRegistry()
+
+
+def get_client(service: str, region: str = None, **overrides):
+    return clients.get(service, region, **overrides)
@@ -1,29 +1,63 @@
 import os
 import json
+import random
+import threading
+import time
 from datetime import datetime
 
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
+from .aws_clients import AWS_REGION, aws_errors, get_client
+from .metrics import AWS_CALL_SECONDS, metrics
+from .transports import ConsumedMessage
 
-AWS_REGION = os.environ.get("AWS_REGION", "eu-west-1")
 SQS_QUEUE_URL = os.environ.get("SQS_QUEUE_URL")
 SNS_TOPIC_ARN = os.environ.get("SNS_TOPIC_ARN")
 
+# SQS accepts at most 10 messages per SendMessageBatch / ReceiveMessage call
+SQS_BATCH_SIZE = 10
+SQS_MAX_WAIT_SECONDS = 20
+
 
 def get_sqs_client():
     """
-    Return a boto3 SQS client.
+    Return the shared boto3 SQS client.
     """
-    return boto3.client("sqs", region_name=AWS_REGION)
+    return get_client("sqs", AWS_REGION)
 
 
 def get_sns_client():
     """
-    Return a boto3 SNS client.
+    Return the shared boto3 SNS client.
+    """
+    return get_client("sns", AWS_REGION)
+
+
+def build_order_event(user_id: int, total: float, items: list) -> dict:
+    """
+    Build the SQS order event payload (without order_id, which is added when
+    the event is stored with its order).
+
+    items is expected to be a list of dicts with keys such as:
+        [{"game_id": 1, "title": "...", "quantity": 2, "price": 9.99}, ...]
     """
-    return boto3.client("sns", region_name=AWS_REGION)
+    return {
+        "user_id": user_id,
+        "total": total,
+        "items": items,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "source": "game-store-web",
+    }
+
 
+def build_order_notification(user_email: str, total: float) -> dict:
+    """Build the SNS order notification payload (order_id added on store)."""
+    return {
+        "user_email": user_email,
+        "total": total,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+    }
 
+
+@metrics.timed(AWS_CALL_SECONDS, call="sqs_send_message")
 def send_order_event_to_sqs(order_id: int, user_id: int, total: float, items: list):
     """
     Send an order event message to SQS.
@@ -36,25 +70,50 @@ def send_order_event_to_sqs(order_id: int, user_id: int, total: float, items: li
 
     sqs = get_sqs_client()
 
-    payload = {
-        "order_id": order_id,
-        "user_id": user_id,
-        "total": total,
-        "items": items,
-        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
-        "source": "game-store-web",
-    }
+    payload = dict(build_order_event(user_id, total, items), order_id=order_id)
 
     try:
         sqs.send_message(
             QueueUrl=SQS_QUEUE_URL,
             MessageBody=json.dumps(payload),
         )
-    except (BotoCoreError, ClientError) as e:
+    except aws_errors() as e:
         raise RuntimeError(f"Failed to send order event to SQS: {e}") from e
 
 
-def notify_order_via_sns(order_id: int, user_email: str, total: float):
+@metrics.timed(AWS_CALL_SECONDS, call="sqs_send_message_batch")
+def send_order_events_batch(messages: list) -> dict:
+    """
+    Send up to SQS_BATCH_SIZE order events with one SendMessageBatch call.
+
+    messages: list of (entry_id, body) with body already JSON-encoded.
+    Returns {entry_id: error} for the entries SQS rejected; raises
+    RuntimeError if the call itself fails.
+    """
+    if not SQS_QUEUE_URL:
+        raise RuntimeError("SQS_QUEUE_URL environment variable is not set.")
+
+    sqs = get_sqs_client()
+
+    try:
+        response = sqs.send_message_batch(
+            QueueUrl=SQS_QUEUE_URL,
+            Entries=[
+                {"Id": str(entry_id), "MessageBody": body}
+                for entry_id, body in messages
+            ],
+        )
+    except aws_errors() as e:
+        raise RuntimeError(f"Failed to send order events to SQS: {e}") from e
+
+    return {
+        failed["Id"]: f"{failed.get('Code')}: {failed.get('Message', '')}"
+        for failed in response.get("Failed", [])
+    }
+
+
+@metrics.timed(AWS_CALL_SECONDS, call="sns_publish")
+def notify_order_via_sns(order_id: int, user_email: str, total: float, created_at: str = None):
     """
     Publish a simple notification to SNS when an order is placed.
     """
@@ -63,13 +122,14 @@ def notify_order_via_sns(order_id: int, user_email: str, total: float):
 
     sns = get_sns_client()
 
+    created_at = created_at or datetime.utcnow().isoformat(timespec="seconds")
     subject = f"New Game Store Order #{order_id}"
     message = (
         f"A new order has been placed.\n\n"
         f"Order ID: {order_id}\n"
         f"Buyer: {user_email}\n"
         f"Total: €{total:.2f}\n"
-        f"Time (UTC): {datetime.utcnow().isoformat(timespec='seconds')}\n"
+        f"Time (UTC): {created_at}\n"
     )
 
     try:
@@ -78,5 +138,226 @@ def notify_order_via_sns(order_id: int, user_email: str, total: float):
             Subject=subject,
             Message=message,
         )
-    except (BotoCoreError, ClientError) as e:
-        raise RuntimeError(f"Failed to publish order notification to SNS: {e}") from e
\ No newline at end of file
+    except aws_errors() as e:
+        raise RuntimeError(f"Failed to publish order notification to SNS: {e}") from e
+
+
+def _chunks(items, size=SQS_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class SQSTransport:
+    """
+    Order event transport over SQS, with notifications published to SNS
+    (see gamestore_lib.transports for the interface).
+
+    Receives use a client of their own whose read timeout outlasts a 20
+    second long poll; the shared client's is shorter.
+    """
+
+    max_batch = SQS_BATCH_SIZE
+
+    def __init__(self, queue_url: str = None):
+        self.queue_url = queue_url or SQS_QUEUE_URL
+
+    def _receive_client(self):
+        return get_client("sqs", AWS_REGION, read_timeout=SQS_MAX_WAIT_SECONDS + 10)
+
+    def send_events(self, messages) -> dict:
+        return send_order_events_batch(messages)
+
+    def notify(self, payload: dict):
+        notify_order_via_sns(
+            order_id=payload["order_id"],
+            user_email=payload["user_email"],
+            total=payload["total"],
+            created_at=payload.get("created_at"),
+        )
+
+    def receive(self, max_messages: int, wait_seconds: float, visibility_timeout: float) -> list:
+        response = self._receive_client().receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, SQS_BATCH_SIZE),
+            WaitTimeSeconds=int(min(wait_seconds, SQS_MAX_WAIT_SECONDS)),
+            VisibilityTimeout=int(visibility_timeout),
+            AttributeNames=["ApproximateReceiveCount", "SentTimestamp"],
+        )
+        return [ConsumedMessage.from_sqs(message) for message in response.get("Messages", [])]
+
+    def peek(self, max_messages: int) -> list:
+        """
+        SQS has no read-only peek: this receives with a zero visibility
+        timeout, so the messages stay available to consumers but their
+        receive count still goes up by one (see the consumer's max_receives).
+        Waits up to 2 seconds, as a short poll only samples some servers.
+        """
+        return self.receive(max_messages, 2, 0)
+
+    def delete(self, messages):
+        for chunk in _chunks(messages):
+            response = get_sqs_client().delete_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(i), "ReceiptHandle": m.receipt_handle}
+                    for i, m in enumerate(chunk)
+                ],
+            )
+            for failed in response.get("Failed", []):
+                print("SQS delete failed:", failed.get("Code"), failed.get("Message", ""))
+
+    def change_visibility(self, entries):
+        for chunk in _chunks(entries):
+            try:
+                get_sqs_client().change_message_visibility_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        {
+                            "Id": str(i),
+                            "ReceiptHandle": m.receipt_handle,
+                            # SQS allows at most 12 hours
+                            "VisibilityTimeout": int(min(seconds, 43200)),
+                        }
+                        for i, (m, seconds) in enumerate(chunk)
+                    ],
+                )
+            except aws_errors() as e:
+                # the messages reappear when their current timeout ends
+                print("SQS visibility change failed:", e)
+
+    def backlog(self):
+        try:
+            attributes = get_sqs_client().get_queue_attributes(
+                QueueUrl=self.queue_url,
+                AttributeNames=["ApproximateNumberOfMessages"],
+            )["Attributes"]
+        except aws_errors():
+            return None
+        return int(attributes["ApproximateNumberOfMessages"])
+
+
+class OutboxDispatcher:
+    """
+    Background thread that delivers outbox events to SQS and SNS.
+
+    The outbox itself lives in the database and is reached through three
+    callables, each returning once its write is committed:
+
+    - claim(limit) -> rows with id, destination ("sqs" / "sns"), payload
+      (JSON text) and attempts, leased so other dispatchers skip them
+    - complete(event_ids) marks events delivered
+    - fail(failures) stores (event_id, attempts, next_attempt_at, status,
+      error) tuples; status is "pending" to retry or "failed" to give up
+    - purge() (optional) deletes delivered events past their retention;
+      called every `purge_interval` seconds
+
+    Events go to `transport` (SQSTransport by default) transport.max_batch
+    per call. Failed events are retried with jittered exponential backoff,
+    so delivery is at-least-once: consumers should de-duplicate on order_id.
+    """
+
+    def __init__(self, claim, complete, fail, poll_interval: float = 5.0,
+                 batch_size: int = 100, base_delay: float = 2.0,
+                 max_delay: float = 900.0, max_attempts: int = 12, transport=None,
+                 purge=None, purge_interval: float = 3600.0):
+        self._claim = claim
+        self._complete = complete
+        self._fail = fail
+        self._purge = purge
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self.transport = transport or SQSTransport()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.delivered = 0
+        self.failed = 0
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="outbox-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def notify(self):
+        """Wake the dispatcher now instead of at the next poll."""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                self._purge_if_due()
+                handled = self.dispatch_once()
+            except Exception as e:
+                # e.g. the database is locked; try again on the next poll
+                print("Outbox dispatch error:", e)
+                handled = 0
+            # keep draining while there is a backlog, otherwise sleep
+            if handled < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _purge_if_due(self):
+        if self._purge is None or time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + self.purge_interval
+        purged = self._purge()
+        if purged:
+            print(f"Purged {purged} delivered outbox events.")
+
+    def dispatch_once(self) -> int:
+        """Claim and deliver one batch of due events; returns how many."""
+        rows = self._claim(self.batch_size)
+        if not rows:
+            return 0
+
+        errors = {}
+        sqs_rows = [row for row in rows if row["destination"] == "sqs"]
+        for chunk in _chunks(sqs_rows, self.transport.max_batch):
+            try:
+                rejected = self.transport.send_events(
+                    [(row["id"], row["payload"]) for row in chunk]
+                )
+            except RuntimeError as e:
+                rejected = {str(row["id"]): str(e) for row in chunk}
+            for row in chunk:
+                if str(row["id"]) in rejected:
+                    errors[row["id"]] = rejected[str(row["id"])]
+
+        for row in rows:
+            if row["destination"] == "sqs":
+                continue
+            try:
+                if row["destination"] != "sns":
+                    raise RuntimeError(f"Unknown outbox destination {row['destination']!r}")
+                self.transport.notify(json.loads(row["payload"]))
+            except (RuntimeError, KeyError, ValueError) as e:
+                errors[row["id"]] = str(e)
+
+        delivered = [row["id"] for row in rows if row["id"] not in errors]
+        if delivered:
+            self._complete(delivered)
+        if errors:
+            self._fail([self._retry_plan(row, errors[row["id"]])
+                        for row in rows if row["id"] in errors])
+
+        self.delivered += len(delivered)
+        self.failed += len(errors)
+        return len(rows)
+
+    def _retry_plan(self, row, error):
+        attempts = row["attempts"] + 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        status = "failed" if attempts >= self.max_attempts else "pending"
+        return (row["id"], attempts, time.time() + delay, status, error)
+
+    def stats(self) -> dict:
+        return {"delivered": self.delivered, "failed": self.failed}
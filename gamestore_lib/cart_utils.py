@@ -1,15 +1,38 @@
-def calculate_cart_total(cart: dict) -> float:
+def calculate_cart_total(cart: dict, games: dict) -> float:
     """
     Calculate the total value of a cart.
+
+    cart is {game_id: quantity}; games is {game_id: game} with current
+    prices. Games missing from `games` (deleted) are not counted.
     """
     total = 0.0
-    for item in cart.values():
-        total += float(item["price"]) * int(item["quantity"])
+    for game_id, quantity in cart.items():
+        game = games.get(game_id)
+        if game is not None:
+            total += float(game["price"]) * int(quantity)
     return total
 
 
 def cart_item_count(cart: dict) -> int:
     """
-    Count total number of items in a cart.
+    Count total number of items in a cart ({game_id: quantity}).
+    """
+    return sum(int(quantity) for quantity in cart.values())
+
+
+def cart_lines(cart: dict, games: dict) -> dict:
+    """
+    Build the per-line view of a cart used by the cart and checkout pages:
+    {game_id: {"id", "title", "price", "quantity"}}, priced from `games`.
     """
-    return sum(int(item["quantity"]) for item in cart.values())
\ No newline at end of file
+    lines = {}
+    for game_id, quantity in cart.items():
+        game = games.get(game_id)
+        if game is not None:
+            lines[game_id] = {
+                "id": game_id,
+                "title": game["title"],
+                "price": float(game["price"]),
+                "quantity": int(quantity),
+            }
+    return lines
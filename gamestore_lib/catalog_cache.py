@@ -0,0 +1,136 @@
+import threading
+import time
+
+from .lru_cache import LRUCache
+
+
+class GameRecord:
+    """
+    Compact, immutable-by-convention copy of a games row.
+
+    Unlike sqlite3.Row it does not hold on to a cursor or connection, and it
+    supports game["title"] as well as game.title so templates work unchanged.
+    """
+
+    __slots__ = ("id", "title", "description", "price", "image_url", "seller_id")
+
+    def __init__(self, id, title, description, price, image_url, seller_id):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.price = price
+        self.image_url = image_url
+        self.seller_id = seller_id
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row["id"],
+            row["title"],
+            row["description"],
+            row["price"],
+            row["image_url"],
+            row["seller_id"],
+        )
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def keys(self):
+        return self.__slots__
+
+    def __repr__(self):
+        return f"GameRecord(id={self.id!r}, title={self.title!r})"
+
+
+class CatalogVersion:
+    """
+    Per-process view of the catalog version counter.
+
+    `version_fn()` reads the counter from the database (bumped by every write
+    to games, in any process). It is re-read at most once every
+    `check_interval` seconds, so other workers' writes become visible within
+    that window; call refresh() after this process's own writes to see them
+    immediately.
+    """
+
+    def __init__(self, version_fn, check_interval: float = 1.0):
+        self._version_fn = version_fn
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+
+    def current(self):
+        if time.monotonic() - self._checked_at >= self._check_interval:
+            self.refresh()
+        return self._version
+
+    def refresh(self):
+        version = self._version_fn()
+        with self._lock:
+            self._version = version
+            self._checked_at = time.monotonic()
+        return version
+
+
+class GameCache:
+    """
+    Bounded LRU cache of GameRecord objects shared by all requests in a process.
+
+    `loader(ids)` must return GameRecords for whichever of `ids` exist.
+    `version_fn()` returns the current catalog version (e.g.
+    CatalogVersion.current); when it changes the whole cache is dropped.
+    This process's own writes should also invalidate entries explicitly.
+    """
+
+    def __init__(self, loader, version_fn, maxsize: int = 4096):
+        self._loader = loader
+        self._version_fn = version_fn
+        self._cache = LRUCache(maxsize=maxsize)
+        self._version = None
+
+    def _check_version(self):
+        version = self._version_fn()
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+
+    def get(self, game_id: int):
+        """Return the GameRecord for game_id, or None if it does not exist."""
+        return self.get_many([game_id]).get(game_id)
+
+    def get_many(self, ids) -> dict:
+        """Return {game_id: GameRecord} for the ids that exist, in one query for misses."""
+        self._check_version()
+
+        found = {}
+        missing = []
+        for game_id in ids:
+            record = self._cache.get(game_id)
+            if record is None:
+                missing.append(game_id)
+            else:
+                found[game_id] = record
+
+        if missing:
+            for record in self._loader(missing):
+                self._cache.set(record.id, record)
+                found[record.id] = record
+
+        return found
+
+    def invalidate(self, game_id: int = None):
+        """Drop one game (after an edit / delete) or everything."""
+        if game_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(game_id)
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        stats["version"] = self._version
+        return stats
@@ -0,0 +1,63 @@
+import gzip
+import os
+
+# Text formats worth compressing; images, archives and fonts are already compressed
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+}
+
+PRECOMPRESS_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".html")
+
+
+def is_compressible(mimetype) -> bool:
+    return mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def gzip_sibling(path: str):
+    """
+    Return the path of an up-to-date precompressed copy of `path`
+    (path + ".gz", at least as new as the original), or None.
+    """
+    gz_path = path + ".gz"
+    try:
+        if os.path.getmtime(gz_path) >= os.path.getmtime(path):
+            return gz_path
+    except OSError:
+        pass
+    return None
+
+
+def precompress_files(folder: str, extensions=PRECOMPRESS_EXTENSIONS,
+                      min_size: int = 256, compresslevel: int = 9) -> int:
+    """
+    Write a .gz sibling next to every text asset under `folder` that is at
+    least `min_size` bytes and has no up-to-date one yet.
+
+    Meant to run at build or startup time so static files are never
+    compressed per request. Returns the number of files written.
+    """
+    written = 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if not name.endswith(extensions):
+                continue
+            path = os.path.join(root, name)
+            if os.path.getsize(path) < min_size or gzip_sibling(path):
+                continue
+
+            with open(path, "rb") as f:
+                data = gzip.compress(f.read(), compresslevel=compresslevel, mtime=0)
+            # write-then-rename so concurrent workers never serve a partial file
+            tmp_path = f"{path}.gz.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path + ".gz")
+            written += 1
+    return written
@@ -0,0 +1,212 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Receive batch and long-poll limits (SQS allows at most 10 and 20 seconds)
+RECEIVE_BATCH_SIZE = 10
+RECEIVE_WAIT_SECONDS = 20
+
+# status an order moves to once its event has been consumed
+CONSUMED_ORDER_STATUS = "CONFIRMED"
+
+
+def order_event_updates(messages, default_status: str = CONSUMED_ORDER_STATUS):
+    """
+    Turn order event messages into ([(order_id, status)], rejected ids).
+
+    Events are de-duplicated on order_id, since delivery is at-least-once;
+    messages without a usable order_id are rejected.
+    """
+    rejected = []
+    updates = {}
+    for message in messages:
+        try:
+            order_id = int(message.body["order_id"])
+        except (KeyError, TypeError, ValueError):
+            rejected.append(message.message_id)
+            continue
+        updates[order_id] = message.body.get("status", default_status)
+    return list(updates.items()), rejected
+
+
+class EventConsumer:
+    """
+    Long-running order event consumer over any transport (see
+    gamestore_lib.transports).
+
+    The poll loop long-polls for up to RECEIVE_BATCH_SIZE messages at a time
+    and hands each batch to a pool of `workers` threads; it only polls while
+    a worker is free, so received messages never sit in memory long enough
+    to time out. A heartbeat thread extends the visibility timeout of
+    messages whose handler is still running.
+
+    handle(messages) gets a list of ConsumedMessage and returns the ids of
+    messages it rejects as malformed; it raises to fail the whole batch.
+    Handled messages are acknowledged in batches. Failed ones become visible
+    again after a backoff, and messages that are malformed or have been
+    received more than `max_receives` times are passed to park(messages)
+    (e.g. a dead-letter queue) and deleted.
+    """
+
+    def __init__(self, transport, handle, park, workers: int = 4,
+                 wait_seconds: float = RECEIVE_WAIT_SECONDS,
+                 visibility_timeout: int = 60, max_receives: int = 5,
+                 retry_delay: int = 10, report_interval: float = 60.0):
+        self.transport = transport
+        self._handle = handle
+        self._park = park
+        self.workers = workers
+        self.wait_seconds = wait_seconds
+        self.visibility_timeout = visibility_timeout
+        self.max_receives = max_receives
+        self.retry_delay = retry_delay
+        # None: no periodic reports
+        self.report_interval = report_interval
+
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.parked = 0
+        self.lag_seconds = 0.0
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(workers)
+        # receipt handle -> (message, time its visibility runs out)
+        self._in_flight = {}
+        self._stopped = threading.Event()
+        self._drained = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="event-worker")
+        self._heartbeat = threading.Thread(
+            target=self._run_heartbeat, name="event-heartbeat", daemon=True
+        )
+
+    def stop(self):
+        """Stop polling; run() returns once in-flight batches are finished."""
+        self._stopped.set()
+
+    def run(self):
+        """Poll until stop() is called, then drain the worker pool."""
+        self._heartbeat.start()
+        next_report = time.monotonic() + (self.report_interval or 0)
+        try:
+            while not self._stopped.is_set():
+                if not self._slots.acquire(timeout=1):
+                    continue
+                try:
+                    messages = self.receive()
+                except Exception as e:
+                    self._slots.release()
+                    print("Order event receive error:", e)
+                    self._stopped.wait(self.retry_delay)
+                    continue
+
+                if messages:
+                    self._executor.submit(self._process, messages)
+                else:
+                    self._slots.release()
+
+                if self.report_interval and time.monotonic() >= next_report:
+                    print(self.report())
+                    next_report = time.monotonic() + self.report_interval
+        finally:
+            self._executor.shutdown(wait=True)
+            self._drained.set()
+            self._heartbeat.join()
+            if self.report_interval:
+                print(self.report())
+
+    def receive(self) -> list:
+        messages = self.transport.receive(
+            RECEIVE_BATCH_SIZE, self.wait_seconds, self.visibility_timeout
+        )
+        deadline = time.monotonic() + self.visibility_timeout
+        with self._lock:
+            self.received += len(messages)
+            for message in messages:
+                self._in_flight[message.receipt_handle] = (message, deadline)
+        return messages
+
+    def _process(self, messages):
+        try:
+            poison = [
+                m for m in messages
+                if m.body is None or m.receive_count > self.max_receives
+            ]
+            batch = [m for m in messages if m not in poison]
+            try:
+                rejected = set(self._handle(batch)) if batch else set()
+            except Exception as e:
+                print("Order event batch failed:", e)
+                self._retry_later(batch)
+                handled = []
+            else:
+                poison.extend(m for m in batch if m.message_id in rejected)
+                handled = [m for m in batch if m.message_id not in rejected]
+
+            if poison:
+                self._park(poison)
+            self.transport.delete(handled + poison)
+
+            now = time.time()
+            with self._lock:
+                self.processed += len(handled)
+                self.parked += len(poison)
+                if handled:
+                    self.lag_seconds = max(now - m.sent_at for m in handled)
+        except Exception as e:
+            # unacknowledged messages are received again after the timeout
+            print("Order event batch error:", e)
+        finally:
+            with self._lock:
+                for message in messages:
+                    self._in_flight.pop(message.receipt_handle, None)
+            self._slots.release()
+
+    def _retry_later(self, messages):
+        """Make failed messages visible again after a backoff that grows per receive."""
+        with self._lock:
+            self.failed += len(messages)
+        self.transport.change_visibility(
+            [(m, self.retry_delay * 2 ** (m.receive_count - 1)) for m in messages]
+        )
+
+    def _run_heartbeat(self):
+        interval = max(1.0, self.visibility_timeout / 3)
+        while not self._drained.wait(interval):
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    message for message, deadline in self._in_flight.values()
+                    if deadline - now < self.visibility_timeout / 2
+                ]
+                for message in due:
+                    self._in_flight[message.receipt_handle] = (
+                        message, now + self.visibility_timeout
+                    )
+            if due:
+                try:
+                    self.transport.change_visibility(
+                        [(message, self.visibility_timeout) for message in due]
+                    )
+                except Exception as e:
+                    print("Order event visibility extension failed:", e)
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        with self._lock:
+            return {
+                "received": self.received,
+                "processed": self.processed,
+                "failed": self.failed,
+                "parked": self.parked,
+                "in_flight": len(self._in_flight),
+                "per_second": round(self.processed / elapsed, 2),
+                "lag_seconds": round(self.lag_seconds, 2),
+            }
+
+    def report(self) -> str:
+        stats = self.stats()
+        return (
+            "processed {processed} ({per_second}/s), failed {failed}, parked {parked}, "
+            "in flight {in_flight}, lag {lag_seconds}s, backlog {backlog}"
+        ).format(backlog=self.transport.backlog(), **stats)
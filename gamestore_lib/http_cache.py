@@ -0,0 +1,24 @@
+import hashlib
+from datetime import datetime, timezone
+
+
+def make_etag(*parts) -> str:
+    """
+    Build an opaque strong ETag value (without quotes) from the given parts.
+    """
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def parse_sqlite_timestamp(value):
+    """
+    Parse a SQLite CURRENT_TIMESTAMP value ('YYYY-MM-DD HH:MM:SS', UTC) into
+    an aware datetime, or return None.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=timezone.utc)
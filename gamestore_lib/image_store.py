@@ -0,0 +1,96 @@
+import hashlib
+import os
+import re
+import tempfile
+
+# Images are named by the SHA-256 of their bytes, so a URL never changes
+# meaning and can be cached forever; identical uploads share one object.
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "gif": "image/gif",
+}
+IMAGE_KEY_RE = re.compile(r"^[0-9a-f]{64}\.(?:png|jpg|gif)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def image_extension(filename: str) -> str:
+    """Normalised extension for an upload ("photo.JPEG" -> "jpg"), or ""."""
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    ext = "jpg" if ext == "jpeg" else ext
+    return ext if ext in IMAGE_CONTENT_TYPES else ""
+
+
+def is_image_key(key: str) -> bool:
+    return bool(IMAGE_KEY_RE.match(key))
+
+
+def hash_stream(stream, sink=None, chunk_size: int = CHUNK_SIZE):
+    """
+    Read `stream` to the end in chunks, feeding each one to SHA-256 and,
+    if given, writing it to `sink`. Returns (hex digest, size in bytes).
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        if sink is not None:
+            sink.write(chunk)
+        size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+class StoredImage:
+    """Result of ImageStore.save(); `created` is False for a deduplicated upload."""
+
+    __slots__ = ("key", "url", "size", "created")
+
+    def __init__(self, key, url, size, created):
+        self.key = key
+        self.url = url
+        self.size = size
+        self.created = created
+
+
+class LocalImageStore:
+    """
+    Content-addressed images in a local directory.
+
+    The upload is copied into a temporary file next to its final location
+    while being hashed, then renamed to "<sha256>.<ext>", so the bytes are
+    written once and readers never see a partial file. If an object with
+    that name already exists the temporary copy is simply discarded.
+    """
+
+    def __init__(self, root: str, url_prefix: str = "/images"):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        os.makedirs(root, exist_ok=True)
+
+    def url_for(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def save(self, stream, extension: str) -> StoredImage:
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as sink:
+                digest, size = hash_stream(stream, sink)
+
+            key = f"{digest}.{extension}"
+            path = self.path_for(key)
+            created = not os.path.exists(path)
+            if created:
+                os.replace(tmp_path, path)
+            return StoredImage(key, self.url_for(key), size, created)
+        except OSError as e:
+            raise RuntimeError(f"Failed to store image: {e}") from e
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ImageUploadPool:
+    """
+    Bounded background pool that moves spooled game images to remote storage.
+
+    Pending uploads live in the database and are reached through callables,
+    like the order outbox:
+
+    - claim(limit) -> rows with game_id, image_key, spool_path and attempts,
+      leased so other pools skip them
+    - upload(row) -> public URL of the stored image; raises RuntimeError
+    - complete(row, url) points the game at url and drops the pending upload
+    - fail(failures) stores (game_id, image_key, attempts, next_attempt_at,
+      status, error) tuples; status is "pending" to retry or "failed"
+
+    At most `workers` uploads run at once; a dispatcher thread only claims
+    as many rows as there are idle workers. Failed uploads are retried with
+    jittered exponential backoff.
+    """
+
+    def __init__(self, claim, upload, complete, fail, workers: int = 4,
+                 poll_interval: float = 5.0, base_delay: float = 5.0,
+                 max_delay: float = 900.0, max_attempts: int = 8):
+        self._claim = claim
+        self._upload = upload
+        self._complete = complete
+        self._fail = fail
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.uploaded = 0
+        self.failed = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="image-upload"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="image-upload-dispatcher", daemon=True
+        )
+        self._thread.start()
+
+    def notify(self):
+        """Wake the dispatcher now instead of at the next poll."""
+        self._wakeup.set()
+
+    def stop(self):
+        """Stop claiming new uploads and wait for running ones to finish."""
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                claimed = self.dispatch_once()
+            except Exception as e:
+                # e.g. the database is locked; try again on the next poll
+                print("Image upload dispatch error:", e)
+                claimed = 0
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def dispatch_once(self) -> int:
+        """Claim due uploads for the idle workers and start them; returns how many."""
+        with self._lock:
+            idle = self.workers - self._in_flight
+        if idle <= 0:
+            return 0
+
+        rows = self._claim(idle)
+        with self._lock:
+            self._in_flight += len(rows)
+        for row in rows:
+            self._executor.submit(self._upload_one, row)
+        return len(rows)
+
+    def _upload_one(self, row):
+        try:
+            try:
+                url = self._upload(row)
+            except (RuntimeError, OSError) as e:
+                self._fail([self._retry_plan(row, str(e))])
+                with self._lock:
+                    self.failed += 1
+            else:
+                self._complete(row, url)
+                with self._lock:
+                    self.uploaded += 1
+        except Exception as e:
+            # the row's lease runs out and it is claimed again
+            print("Image upload bookkeeping error:", e)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._wakeup.set()
+
+    def _retry_plan(self, row, error):
+        attempts = row["attempts"] + 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        status = "failed" if attempts >= self.max_attempts else "pending"
+        return (row["game_id"], row["image_key"], attempts, time.time() + delay, status, error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = self._in_flight
+        return {"uploaded": self.uploaded, "failed": self.failed, "in_flight": in_flight}
@@ -0,0 +1,210 @@
+import bisect
+import functools
+import glob
+import json
+import os
+import threading
+import time
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Time spent in calls to AWS, labelled by call
+AWS_CALL_SECONDS = "gamestore_aws_call_seconds"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    In-process counters and histograms, rendered in Prometheus text format.
+
+    Updates are lock-free: each thread writes to its own shard (a plain
+    dict), and only scrapes take the lock to merge the shards. Shards of
+    finished threads are folded into one retired shard, so a thread per
+    request does not grow the registry. Everything is reset in forked
+    children.
+
+    For pre-forked servers, write_snapshot(directory) stores this process's
+    totals in <directory>/<pid>.json and collect(directory) merges the
+    files of every process.
+    """
+
+    def __init__(self):
+        self._meta = {"counter": {}, "histogram": {}}
+        self._help = {}
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+        # (thread, shard) pairs
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str):
+        self._meta["counter"][name] = None
+        self._help[name] = help_text
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self._meta["histogram"][name] = tuple(buckets)
+        self._help[name] = help_text
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name: str, value: float = 1, **labels):
+        shard = self._shard()
+        key = (name, tuple(sorted(labels.items())))
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self._meta["histogram"].get(name, DEFAULT_BUCKETS)
+        shard = self._shard()
+        key = (name, tuple(sorted(labels.items())))
+        counts = shard.get(key)
+        if counts is None:
+            # one count per bucket plus +Inf, then sum and count
+            counts = shard[key] = [0] * (len(buckets) + 3)
+        counts[bisect.bisect_left(buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def time(self, name: str, **labels):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, name, labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator observing the duration of every call."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with _Timer(self, name, labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _merge(into: dict, shard: dict):
+        for key, value in shard.items():
+            current = into.get(key)
+            if current is None:
+                into[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                for i, v in enumerate(value):
+                    current[i] += v
+            else:
+                into[key] = current + value
+
+    def snapshot(self) -> dict:
+        """Totals of every thread, {(name, labels): value or histogram counts}."""
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = live
+            totals = {}
+            self._merge(totals, self._retired)
+            for _, shard in live:
+                # a copy, so the owning thread may keep writing
+                self._merge(totals, dict(shard))
+        return totals
+
+    def write_snapshot(self, directory: str):
+        """Store this process's totals for collect() in other processes."""
+        entries = [[name, labels, value] for (name, labels), value in self.snapshot().items()]
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, path)
+
+    def collect(self, directory: str = None) -> dict:
+        """This process's totals plus, with a directory, every other process's."""
+        totals = self.snapshot()
+        if not directory:
+            return totals
+        own = f"{os.getpid()}.json"
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            if os.path.basename(path) == own:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._merge(totals, {
+                (name, tuple(tuple(pair) for pair in labels)): value
+                for name, labels, value in entries
+            })
+        return totals
+
+    def render(self, totals: dict = None) -> str:
+        """Prometheus text exposition of `totals` (default: this process)."""
+        totals = self.snapshot() if totals is None else totals
+        by_name = {}
+        for (name, labels), value in sorted(totals.items()):
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, series in by_name.items():
+            kind = "histogram" if name in self._meta["histogram"] else "counter"
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                    continue
+                buckets = self._meta["histogram"][name]
+                cumulative = 0
+                for bound, count in zip(buckets + (float("inf"),), value):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {value[-2]:g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+# Process-wide registry used by the app and by gamestore_lib's AWS helpers
+metrics = MetricsRegistry()
+metrics.histogram(AWS_CALL_SECONDS, "Duration of calls to AWS services.")
@@ -0,0 +1,56 @@
+import base64
+import binascii
+import json
+import math
+
+# SQLite integers are signed 64-bit; larger Python ints cannot be bound
+SQLITE_INT_MIN = -2 ** 63
+SQLITE_INT_MAX = 2 ** 63 - 1
+
+
+def is_sqlite_int(value) -> bool:
+    """True for an int (not a bool) that SQLite can store."""
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and SQLITE_INT_MIN <= value <= SQLITE_INT_MAX
+    )
+
+
+def _is_sort_value(value) -> bool:
+    if isinstance(value, str):
+        return True
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return is_sqlite_int(value)
+
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    """
+    Encode the (sort value, id) of a boundary row as an opaque URL-safe cursor.
+    """
+    raw = json.dumps([sort_value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a cursor produced by encode_cursor().
+
+    Returns a (sort_value, id) tuple, or None if the cursor is missing or
+    malformed, so callers can simply fall back to the first page. The sort
+    value must be a string or a number and the id an integer, both within
+    what SQLite can bind.
+    """
+    if not cursor:
+        return None
+
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+    if not is_sqlite_int(row_id) or not _is_sort_value(sort_value):
+        return None
+    return sort_value, row_id
@@ -0,0 +1,88 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+
+class CachedResponse:
+    """A rendered page stored gzip-compressed, tagged with the catalog version."""
+
+    __slots__ = ("version", "status", "content_type", "body_gz")
+
+    def __init__(self, version, status, content_type, body_gz):
+        self.version = version
+        self.status = status
+        self.content_type = content_type
+        self.body_gz = body_gz
+
+    @property
+    def body(self) -> bytes:
+        return gzip.decompress(self.body_gz)
+
+
+class ResponseCache:
+    """
+    Byte-bounded LRU cache of rendered response bodies.
+
+    Bodies are stored gzip-compressed and the total compressed size is kept
+    under `max_bytes`; single bodies larger than `max_entry_bytes` are not
+    cached. Every entry records the catalog version it was rendered at and
+    is treated as a miss once the version moves on, so catalog writes
+    invalidate all pages at once without walking the cache.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024,
+                 max_entry_bytes: int = 1024 * 1024, compresslevel: int = 6):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.compresslevel = compresslevel
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._drop_locked(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, version, status, content_type, body: bytes):
+        body_gz = gzip.compress(body, compresslevel=self.compresslevel)
+        if len(body_gz) > self.max_entry_bytes:
+            return None
+
+        entry = CachedResponse(version, status, content_type, body_gz)
+        with self._lock:
+            if key in self._entries:
+                self._drop_locked(key)
+            self._entries[key] = entry
+            self._size += len(body_gz)
+            while self._size > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._drop_locked(oldest)
+        return entry
+
+    def _drop_locked(self, key):
+        entry = self._entries.pop(key)
+        self._size -= len(entry.body_gz)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,38 @@
+import re
+
+from markupsafe import Markup, escape
+
+# Control characters used as highlight markers inside FTS5 output.
+# They never appear in user text, so the snippet can be HTML-escaped first
+# and the markers swapped for <mark> tags afterwards.
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_fts_query(text: str, max_terms: int = 8) -> str:
+    """
+    Turn free text typed by a user into a safe FTS5 MATCH expression.
+
+    Every word is quoted (so FTS5 operators and punctuation in the input
+    are treated as plain text) and the last word gets a prefix match so
+    partially typed words still find results. Returns "" if there is
+    nothing searchable in the input.
+    """
+    terms = _TOKEN_RE.findall(text or "")[:max_terms]
+    if not terms:
+        return ""
+
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def highlight_markup(text) -> Markup:
+    """
+    HTML-escape an FTS5 highlight()/snippet() result and wrap matches in <mark>.
+    """
+    escaped = str(escape(text or ""))
+    escaped = escaped.replace(HIGHLIGHT_START, "<mark>").replace(HIGHLIGHT_END, "</mark>")
+    return Markup(escaped)
@@ -0,0 +1,229 @@
+import re
+import sqlite3
+import threading
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b[xX]'[0-9a-fA-F]*'|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_VALUE_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Transaction control the sqlite3 module issues on its own; not worth tracing
+_CONTROL_STATEMENTS = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "END")
+
+# Statements EXPLAIN QUERY PLAN has something to say about
+_PLANNED_STATEMENTS = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    The shape of a statement: comments dropped, string and number literals
+    replaced by ?, lists of values collapsed to (?, ...) and whitespace
+    collapsed, so the same query with different values (or IN lists of
+    different lengths) has the same shape.
+    """
+    sql = _COMMENTS.sub(" ", sql)
+    sql = _LITERALS.sub("?", sql)
+    sql = _VALUE_LISTS.sub("(?, ...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def explain_query_plan(conn, sql: str) -> list:
+    """EXPLAIN QUERY PLAN details for an expanded (literal-only) statement."""
+    try:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+
+
+class TracedQuery:
+    """
+    One execute() / executemany() call. `sql` is the first statement with
+    its values inlined; `executions` counts the statements run (several for
+    executemany); `steps` approximates the work done, in SQLite VM
+    instructions; `rows` counts the rows fetched from its cursor.
+    """
+
+    __slots__ = ("sql", "shape", "seconds", "rows", "steps", "executions", "conn")
+
+    def __init__(self, sql: str, conn=None):
+        self.sql = sql
+        self.shape = normalize_sql(sql)
+        self.seconds = 0.0
+        self.rows = 0
+        self.steps = 0
+        self.executions = 1
+        # weak reference to the connection, to EXPLAIN slow queries
+        self.conn = conn
+
+    def format(self) -> str:
+        calls = f" x{self.executions}" if self.executions > 1 else ""
+        return f"{self.seconds * 1000:8.2f} ms {self.rows:5} rows{calls}  {self.shape}"
+
+
+class QueryTrace:
+    """The statements run by one request (or any traced block) on one thread."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.queries = []
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def seconds(self) -> float:
+        return sum(query.seconds for query in self.queries)
+
+    @property
+    def rows(self) -> int:
+        return sum(query.rows for query in self.queries)
+
+    def shapes(self) -> Counter:
+        return Counter(query.shape for query in self.queries)
+
+    def repeated(self, threshold: int) -> list:
+        """(shape, count) of statements run more than `threshold` times, likely N+1 loops."""
+        return [(shape, count) for shape, count in self.shapes().most_common() if count > threshold]
+
+    def format(self) -> str:
+        lines = [
+            f"{self.label}: {self.count} queries, {self.seconds * 1000:.2f} ms, {self.rows} rows"
+        ]
+        lines.extend("  " + query.format() for query in self.queries)
+        return "\n".join(lines)
+
+
+class SQLTracer:
+    """
+    Opt-in tracing of SQLite statements, built on the trace callback and
+    progress handler of each connection.
+
+    attach(conn) hooks a connection (see db.connection_hooks); on_query and
+    on_rows are db.query_listeners / db.row_listeners hooks. Statements run
+    on a thread between start(label) and finish() are recorded in that
+    thread's QueryTrace; traces nest, and a statement is recorded in every
+    open trace. Statements slower than `slow_seconds` are logged with their
+    EXPLAIN QUERY PLAN, wherever they run; finish() logs the statement shapes
+    repeated more than `repeat_threshold` times.
+    """
+
+    def __init__(self, slow_seconds: float = 0.1, repeat_threshold: int = 10,
+                 progress_steps: int = 1000, log=print):
+        self.slow_seconds = slow_seconds
+        self.repeat_threshold = repeat_threshold
+        self.progress_steps = progress_steps
+        self._log = log
+        self._local = threading.local()
+
+    def _state(self):
+        local = self._local
+        if not hasattr(local, "traces"):
+            local.traces = []
+            # statement traced but not yet reported by on_query
+            local.open = None
+            # last reported statement, which rows and steps are added to
+            local.current = None
+            local.paused = False
+        return local
+
+    def attach(self, conn):
+        conn_ref = weakref.ref(conn)
+        conn.set_trace_callback(lambda sql: self._on_statement(sql, conn_ref))
+        conn.set_progress_handler(self._on_progress, self.progress_steps)
+
+    def _on_statement(self, sql, conn_ref):
+        state = self._state()
+        # "--" lines are statements run by triggers
+        if state.paused or sql.startswith("--") or sql.lstrip().upper().startswith(_CONTROL_STATEMENTS):
+            return
+        query = state.open
+        if query is not None and normalize_sql(sql) == query.shape:
+            # executemany: one more run of the same statement
+            query.executions += 1
+            return
+        state.open = state.current = TracedQuery(sql, conn_ref)
+
+    def _on_progress(self):
+        query = getattr(self._local, "current", None)
+        if query is not None and not self._local.paused:
+            query.steps += self.progress_steps
+        return 0
+
+    def on_query(self, sql, seconds):
+        state = self._state()
+        if state.paused:
+            return
+        query, state.open = state.open, None
+        if query is None:
+            # transaction control, connection setup, or a connection opened
+            # before tracing was switched on
+            return
+        query.seconds = seconds
+        for trace in state.traces:
+            trace.queries.append(query)
+        if seconds >= self.slow_seconds:
+            self._log_slow(query, state)
+
+    def on_rows(self, count):
+        state = self._state()
+        query = state.current
+        if query is not None and not state.paused:
+            query.rows += count
+
+    def _log_slow(self, query, state):
+        conn = query.conn() if query.conn is not None else None
+        plan = []
+        if conn is not None and query.sql.lstrip().upper().startswith(_PLANNED_STATEMENTS):
+            state.paused = True
+            try:
+                plan = explain_query_plan(conn, query.sql)
+            finally:
+                state.paused = False
+        label = state.traces[-1].label if state.traces else threading.current_thread().name
+        self._log(
+            f"Slow query in {label}: {query.seconds * 1000:.1f} ms, "
+            f"{query.steps} steps: {query.sql}"
+            + "".join(f"\n    {detail}" for detail in plan)
+        )
+
+    def start(self, label: str) -> QueryTrace:
+        trace = QueryTrace(label)
+        self._state().traces.append(trace)
+        return trace
+
+    def finish(self) -> QueryTrace:
+        """Close the innermost trace of this thread and log repeated statements."""
+        state = self._state()
+        if not state.traces:
+            return None
+        trace = state.traces.pop()
+        if not state.traces:
+            state.current = None
+        for shape, count in trace.repeated(self.repeat_threshold):
+            self._log(f"Possible N+1 in {trace.label}: {count} x {shape}")
+        return trace
+
+    @contextmanager
+    def trace(self, label: str):
+        trace = self.start(label)
+        try:
+            yield trace
+        finally:
+            self.finish()
+
+
+@contextmanager
+def assert_max_queries(tracer: SQLTracer, limit: int, label: str = "block"):
+    """
+    Fail with AssertionError if the block runs more than `limit` statements
+    on this thread (e.g. one request through Flask's test client). Writes
+    handed to db.run_write() run on the writer thread and are not counted.
+    """
+    with tracer.trace(label) as trace:
+        yield trace
+    if trace.count > limit:
+        raise AssertionError(f"{label} ran {trace.count} queries, expected at most {limit}\n" + trace.format())
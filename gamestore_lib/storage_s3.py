@@ -1,15 +1,47 @@
 import os
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
+import tempfile
+
+from .aws_clients import AWS_REGION, aws_errors, get_client
+from .image_store import IMAGE_CACHE_CONTROL, IMAGE_CONTENT_TYPES, StoredImage, hash_stream
+from .metrics import AWS_CALL_SECONDS, metrics
 
 S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME")
-AWS_REGION = os.environ.get("AWS_REGION", "eu-west-1")
+
+# s3transfer settings for image uploads; each can be overridden with the
+# environment variable of the same name. Files above the threshold go up
+# as multipart uploads of CHUNKSIZE parts, MAX_CONCURRENCY parts at a time.
+S3_TRANSFER_DEFAULTS = {
+    "S3_MULTIPART_THRESHOLD": 8 * 1024 * 1024,
+    "S3_MULTIPART_CHUNKSIZE": 8 * 1024 * 1024,
+    "S3_MAX_CONCURRENCY": 4,
+}
+
+
+def _transfer_setting(name):
+    default = S3_TRANSFER_DEFAULTS[name]
+    value = os.environ.get(name)
+    return default if value is None else type(default)(value)
+
+
+def build_transfer_config(**overrides):
+    """boto3 TransferConfig for image uploads; keyword arguments override options."""
+    from boto3.s3.transfer import TransferConfig
+
+    options = {
+        "multipart_threshold": _transfer_setting("S3_MULTIPART_THRESHOLD"),
+        "multipart_chunksize": _transfer_setting("S3_MULTIPART_CHUNKSIZE"),
+        "max_concurrency": _transfer_setting("S3_MAX_CONCURRENCY"),
+        "use_threads": True,
+    }
+    options.update(overrides)
+    return TransferConfig(**options)
 
 
 def get_s3_client():
-    return boto3.client("s3", region_name=AWS_REGION)
+    return get_client("s3", AWS_REGION)
 
 
+@metrics.timed(AWS_CALL_SECONDS, call="s3_upload_game_image")
 def upload_game_image(file_storage, filename: str) -> str:
     """
     Upload a game image to S3 and return the public URL.
@@ -36,8 +68,113 @@ def upload_game_image(file_storage, filename: str) -> str:
             ExtraArgs=extra_args
         )
 
-    except (BotoCoreError, ClientError) as e:
+    except aws_errors() as e:
         raise RuntimeError(f"Failed to upload image to S3: {e}") from e
 
     url = f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{key}"
-    return url
\ No newline at end of file
+    return url
+
+
+class S3ImageStore:
+    """
+    Content-addressed images in an S3 bucket under `prefix`.
+
+    Seekable uploads (Werkzeug spools request files to memory or disk) are
+    hashed in one pass and then rewound and streamed straight to S3, so they
+    are never copied; anything else is spooled once while it is hashed.
+    A HEAD request skips the upload when the object already exists. Objects
+    are written with an immutable Cache-Control header, which S3 (and any
+    CDN in front of it) returns on every GET. `public_url` replaces the
+    default bucket URL, e.g. with a CloudFront domain.
+    """
+
+    def __init__(self, bucket: str = None, prefix: str = "game-images/",
+                 public_url: str = None, client_factory=get_s3_client,
+                 spool_max_bytes: int = 8 * 1024 * 1024, transfer_config=None):
+        self.bucket = bucket or S3_BUCKET_NAME
+        if not self.bucket:
+            raise RuntimeError("S3_BUCKET_NAME environment variable is not set.")
+        self.prefix = prefix
+        self.public_url = (
+            public_url or f"https://{self.bucket}.s3.{AWS_REGION}.amazonaws.com"
+        ).rstrip("/")
+        self._client_factory = client_factory
+        self._spool_max_bytes = spool_max_bytes
+        self._transfer_config = transfer_config
+
+    @property
+    def transfer_config(self):
+        if self._transfer_config is None:
+            self._transfer_config = build_transfer_config()
+        return self._transfer_config
+
+    def _extra_args(self, key):
+        return {
+            "ContentType": IMAGE_CONTENT_TYPES[key.rsplit(".", 1)[1]],
+            "CacheControl": IMAGE_CACHE_CONTROL,
+        }
+
+    def url_for(self, key: str) -> str:
+        return f"{self.public_url}/{self.prefix}{key}"
+
+    def exists(self, key: str) -> bool:
+        try:
+            self._client_factory().head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except aws_errors() as e:
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    @metrics.timed(AWS_CALL_SECONDS, call="s3_image_save")
+    def save(self, stream, extension: str) -> StoredImage:
+        spool = None
+        try:
+            if stream.seekable():
+                start = stream.tell()
+                digest, size = hash_stream(stream)
+                stream.seek(start)
+                body = stream
+            else:
+                spool = tempfile.SpooledTemporaryFile(max_size=self._spool_max_bytes)
+                digest, size = hash_stream(stream, spool)
+                spool.seek(0)
+                body = spool
+
+            key = f"{digest}.{extension}"
+            created = not self.exists(key)
+            if created:
+                self._client_factory().upload_fileobj(
+                    Fileobj=body,
+                    Bucket=self.bucket,
+                    Key=self.prefix + key,
+                    ExtraArgs=self._extra_args(key),
+                    Config=self.transfer_config,
+                )
+        except aws_errors() as e:
+            raise RuntimeError(f"Failed to upload image to S3: {e}") from e
+        finally:
+            if spool is not None:
+                spool.close()
+
+        return StoredImage(key, self.url_for(key), size, created)
+
+    @metrics.timed(AWS_CALL_SECONDS, call="s3_image_upload_file")
+    def upload_file(self, path: str, key: str) -> str:
+        """
+        Upload a spooled local file as `key` (its content-addressed name)
+        unless the bucket already has it; returns the public URL.
+        """
+        try:
+            if not self.exists(key):
+                self._client_factory().upload_file(
+                    Filename=path,
+                    Bucket=self.bucket,
+                    Key=self.prefix + key,
+                    ExtraArgs=self._extra_args(key),
+                    Config=self.transfer_config,
+                )
+        except aws_errors() as e:
+            raise RuntimeError(f"Failed to upload image to S3: {e}") from e
+        return self.url_for(key)
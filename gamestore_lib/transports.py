@@ -0,0 +1,373 @@
+"""
+Order event transports.
+
+A transport carries order events from the outbox dispatcher to the event
+consumer, plus the order notifications. Every transport has the same
+methods:
+
+- send_events(messages) sends up to `max_batch` (entry_id, body) pairs,
+  body being JSON text; returns {entry_id: error} for rejected entries
+- notify(payload) publishes an order notification
+- receive(max_messages, wait_seconds, visibility_timeout) waits up to
+  wait_seconds for messages and hides them for visibility_timeout seconds;
+  returns a list of ConsumedMessage
+- peek(max_messages) returns up to max_messages visible messages without
+  receiving them (no receipt handle; SQS cannot do this, see SQSTransport)
+- delete(messages) acknowledges messages
+- change_visibility(entries) hides (message, seconds) pairs for longer
+- backlog() approximate number of visible messages, or None
+
+SQSTransport (in aws_events) talks to SQS / SNS; InProcessTransport and
+SQLiteQueueTransport keep everything on the local machine.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import deque
+
+
+class ConsumedMessage:
+    """One received message; `body` is the decoded JSON, or None if invalid."""
+
+    __slots__ = ("message_id", "receipt_handle", "raw_body", "body",
+                 "receive_count", "sent_at")
+
+    def __init__(self, message_id, receipt_handle, raw_body, receive_count=1, sent_at=None):
+        self.message_id = str(message_id)
+        self.receipt_handle = receipt_handle
+        self.raw_body = raw_body
+        self.receive_count = receive_count
+        self.sent_at = sent_at or time.time()
+        try:
+            self.body = json.loads(raw_body)
+        except ValueError:
+            self.body = None
+
+    @classmethod
+    def from_sqs(cls, message):
+        attributes = message.get("Attributes", {})
+        return cls(
+            message["MessageId"],
+            message["ReceiptHandle"],
+            message["Body"],
+            int(attributes.get("ApproximateReceiveCount", 1)),
+            int(attributes.get("SentTimestamp", 0)) / 1000,
+        )
+
+
+class InProcessTransport:
+    """
+    Queue held in this process's memory: no network, no durability.
+
+    For tests, load tests and development, where the consumer runs as a
+    thread of the same process. Received messages reappear once their
+    visibility timeout runs out unless they are deleted first.
+    """
+
+    max_batch = 500
+
+    def __init__(self, max_notifications: int = 100):
+        self._visible = deque()
+        # receipt handle -> (visible_at, message_id, body, receive_count, sent_at)
+        self._hidden = {}
+        self._condition = threading.Condition()
+        self._next_id = 0
+        self.notifications = deque(maxlen=max_notifications)
+
+    def send_events(self, messages) -> dict:
+        now = time.time()
+        with self._condition:
+            for _, body in messages:
+                self._next_id += 1
+                self._visible.append((self._next_id, body, 0, now))
+            self._condition.notify_all()
+        return {}
+
+    def notify(self, payload: dict):
+        self.notifications.append(payload)
+
+    def _requeue_expired(self, now):
+        for handle, (visible_at, *message) in list(self._hidden.items()):
+            if visible_at <= now:
+                del self._hidden[handle]
+                self._visible.appendleft(tuple(message))
+
+    def receive(self, max_messages: int, wait_seconds: float, visibility_timeout: float) -> list:
+        deadline = time.monotonic() + wait_seconds
+        with self._condition:
+            while True:
+                now = time.time()
+                self._requeue_expired(now)
+                if self._visible:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._condition.wait(min(remaining, 1.0))
+
+            received = []
+            while self._visible and len(received) < max_messages:
+                message_id, body, receive_count, sent_at = self._visible.popleft()
+                handle = secrets.token_hex(8)
+                self._hidden[handle] = (
+                    now + visibility_timeout, message_id, body, receive_count + 1, sent_at
+                )
+                received.append(
+                    ConsumedMessage(message_id, handle, body, receive_count + 1, sent_at)
+                )
+            return received
+
+    def peek(self, max_messages: int) -> list:
+        with self._condition:
+            self._requeue_expired(time.time())
+            return [
+                ConsumedMessage(message_id, None, body, receive_count, sent_at)
+                for message_id, body, receive_count, sent_at
+                in list(self._visible)[:max_messages]
+            ]
+
+    def delete(self, messages):
+        with self._condition:
+            for message in messages:
+                self._hidden.pop(message.receipt_handle, None)
+
+    def change_visibility(self, entries):
+        now = time.time()
+        with self._condition:
+            for message, seconds in entries:
+                hidden = self._hidden.get(message.receipt_handle)
+                if hidden is not None:
+                    self._hidden[message.receipt_handle] = (now + seconds, *hidden[1:])
+            self._condition.notify_all()
+
+    def backlog(self):
+        with self._condition:
+            return len(self._visible)
+
+
+class SQLiteQueueTransport:
+    """
+    Durable queue in a local SQLite file, for single-node deployments.
+
+    Producers and consumers may be different processes on the same machine.
+    A batch is enqueued in one transaction. Dequeuing claims messages by
+    giving them a fresh receipt and pushing visible_at past the visibility
+    timeout; deleting or changing visibility needs that receipt, so a
+    consumer whose messages timed out and were claimed again cannot
+    acknowledge them. Order notifications have no local subscriber (SNS
+    would email them), so they are logged and the latest are kept in
+    memory rather than stored.
+    receive() long-polls: same-process producers wake it at once, others
+    are picked up every `poll_interval` seconds.
+    Acknowledged (and parked) messages are deleted; like SQS, messages that
+    are still queued `retention_seconds` after they were sent are dropped,
+    checked by receive() every `purge_interval` seconds.
+    """
+
+    max_batch = 500
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS queue_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            queue TEXT NOT NULL,
+            body TEXT NOT NULL,
+            sent_at REAL NOT NULL,
+            visible_at REAL NOT NULL,
+            receive_count INTEGER NOT NULL DEFAULT 0,
+            receipt TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_queue_messages_visible
+        ON queue_messages(queue, visible_at, id);
+    """
+
+    # notifications were once stored here and never consumed
+    LEGACY_NOTIFICATION_QUEUE = "order-notifications"
+
+    def __init__(self, path: str, queue: str = "order-events",
+                 poll_interval: float = 0.5, max_notifications: int = 100,
+                 retention_seconds: float = 4 * 24 * 60 * 60, purge_interval: float = 300.0):
+        self.path = path
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self.notifications = deque(maxlen=max_notifications)
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        conn.execute(
+            "DELETE FROM queue_messages WHERE queue = ?", (self.LEGACY_NOTIFICATION_QUEUE,)
+        )
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    @property
+    def conn(self):
+        """One connection per thread (and per process after a fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def _enqueue(self, queue, bodies):
+        now = time.time()
+        conn = self.conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO queue_messages (queue, body, sent_at, visible_at) VALUES (?, ?, ?, ?)",
+                    [(queue, body, now, now) for body in bodies],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Failed to enqueue to the local queue: {e}") from e
+        with self._condition:
+            self._condition.notify_all()
+
+    def send_events(self, messages) -> dict:
+        self._enqueue(self.queue, [body for _, body in messages])
+        return {}
+
+    def notify(self, payload: dict):
+        self.notifications.append(payload)
+        print("Order notification:", json.dumps(payload))
+
+    def _claim(self, max_messages, visibility_timeout):
+        now = time.time()
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                """
+                SELECT id, body, receive_count, sent_at FROM queue_messages
+                WHERE queue = ? AND visible_at <= ?
+                ORDER BY visible_at, id
+                LIMIT ?
+                """,
+                (self.queue, now, max_messages),
+            ).fetchall()
+            claimed = [
+                (id_, body, receive_count + 1, sent_at, secrets.token_hex(8))
+                for id_, body, receive_count, sent_at in rows
+            ]
+            conn.executemany(
+                """
+                UPDATE queue_messages
+                SET visible_at = ?, receive_count = ?, receipt = ?
+                WHERE id = ?
+                """,
+                [(now + visibility_timeout, count, receipt, id_)
+                 for id_, _, count, _, receipt in claimed],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [
+            ConsumedMessage(id_, f"{id_}:{receipt}", body, count, sent_at)
+            for id_, body, count, sent_at, receipt in claimed
+        ]
+
+    def purge(self) -> int:
+        """Drop messages sent more than retention_seconds ago; returns how many."""
+        cur = self.conn.execute(
+            "DELETE FROM queue_messages WHERE queue = ? AND sent_at < ?",
+            (self.queue, time.time() - self.retention_seconds),
+        )
+        if cur.rowcount:
+            print(f"Dropped {cur.rowcount} order events past the {self.retention_seconds:.0f}s retention")
+        return cur.rowcount
+
+    def receive(self, max_messages: int, wait_seconds: float, visibility_timeout: float) -> list:
+        if time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + self.purge_interval
+            self.purge()
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            messages = self._claim(max_messages, visibility_timeout)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                return messages
+            with self._condition:
+                self._condition.wait(min(remaining, self.poll_interval))
+
+    def peek(self, max_messages: int) -> list:
+        rows = self.conn.execute(
+            """
+            SELECT id, body, receive_count, sent_at FROM queue_messages
+            WHERE queue = ? AND visible_at <= ?
+            ORDER BY visible_at, id
+            LIMIT ?
+            """,
+            (self.queue, time.time(), max_messages),
+        ).fetchall()
+        return [
+            ConsumedMessage(id_, None, body, receive_count, sent_at)
+            for id_, body, receive_count, sent_at in rows
+        ]
+
+    @staticmethod
+    def _receipt(message):
+        id_, receipt = message.receipt_handle.split(":", 1)
+        return int(id_), receipt
+
+    def delete(self, messages):
+        self.conn.executemany(
+            "DELETE FROM queue_messages WHERE id = ? AND receipt = ?",
+            [self._receipt(message) for message in messages],
+        )
+
+    def change_visibility(self, entries):
+        now = time.time()
+        self.conn.executemany(
+            "UPDATE queue_messages SET visible_at = ? WHERE id = ? AND receipt = ?",
+            [(now + seconds, *self._receipt(message)) for message, seconds in entries],
+        )
+        with self._condition:
+            self._condition.notify_all()
+
+    def backlog(self):
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM queue_messages WHERE queue = ? AND visible_at <= ?",
+            (self.queue, time.time()),
+        ).fetchone()[0]
+
+
+TRANSPORTS = ("aws", "local", "inprocess")
+
+
+def create_transport(kind: str, local_queue_path: str = None,
+                     local_retention_seconds: float = None):
+    """
+    Build the transport named by `kind`: "aws" (SQS / SNS), "local"
+    (SQLiteQueueTransport at local_queue_path, keeping messages for
+    local_retention_seconds if given) or "inprocess".
+    """
+    if kind == "aws":
+        from .aws_events import SQSTransport
+
+        return SQSTransport()
+    if kind == "local":
+        if not local_queue_path:
+            raise ValueError("The local transport needs a queue file path.")
+        if local_retention_seconds is None:
+            return SQLiteQueueTransport(local_queue_path)
+        return SQLiteQueueTransport(local_queue_path, retention_seconds=local_retention_seconds)
+    if kind == "inprocess":
+        return InProcessTransport()
+    raise ValueError(f"Unknown order event transport {kind!r}; expected one of {TRANSPORTS}")
@@ -1,30 +1,142 @@
-import boto3
-import os
+"""
+Order event consumer.
+
+Long-polls the order event queue, applies the events to orders.status in
+batched UPDATEs and acknowledges them in batches. The queue is SQS
+(SQS_QUEUE_URL) or the local SQLite queue (ORDER_EVENT_QUEUE_PATH), as
+chosen by ORDER_EVENT_TRANSPORT. Malformed events and events that keep
+failing are parked: sent to SQS_DEAD_LETTER_URL if set, otherwise appended
+to PARKED_EVENTS_FILE. Stops gracefully on SIGINT / SIGTERM, finishing the
+batches in flight, and prints throughput and lag every --report-interval
+seconds.
+
+Usage:
+    python read_sqs.py
+    python read_sqs.py --workers 8 --visibility-timeout 120
+    python read_sqs.py --peek
+"""
+import argparse
 import json
+import os
+import signal
+
+import db
+from gamestore_lib import EventConsumer, create_transport, order_event_updates
+from gamestore_lib.aws_clients import aws_errors
+from gamestore_lib.aws_events import get_sqs_client
+
+SQS_DEAD_LETTER_URL = os.environ.get("SQS_DEAD_LETTER_URL")
+PARKED_EVENTS_FILE = os.environ.get("PARKED_EVENTS_FILE", "parked_order_events.jsonl")
+
+# Same defaults as app.py: SQS when a queue is configured, else the local queue
+ORDER_EVENT_TRANSPORT = os.environ.get("ORDER_EVENT_TRANSPORT") or (
+    "aws" if os.environ.get("SQS_QUEUE_URL") else "local"
+)
+ORDER_EVENT_QUEUE_PATH = os.environ.get("ORDER_EVENT_QUEUE_PATH") or os.path.join(
+    os.path.dirname(db.DB_NAME), "order_events.db"
+)
+ORDER_EVENT_RETENTION_SECONDS = float(
+    os.environ.get("ORDER_EVENT_RETENTION_SECONDS", 4 * 24 * 60 * 60)
+)
+
+
+def handle_order_events(messages):
+    """
+    Apply a batch of order events with one write; returns the ids of
+    messages without a usable order_id.
+    """
+    updates, rejected = order_event_updates(messages)
+    if updates:
+        db.run_write(db.apply_order_events, updates)
+    return rejected
+
+
+def park_messages(messages):
+    """Keep poison messages out of the queue without losing them."""
+    if SQS_DEAD_LETTER_URL:
+        try:
+            response = get_sqs_client().send_message_batch(
+                QueueUrl=SQS_DEAD_LETTER_URL,
+                Entries=[
+                    {"Id": str(i), "MessageBody": m.raw_body}
+                    for i, m in enumerate(messages)
+                ],
+            )
+        except aws_errors() as e:
+            raise RuntimeError(f"Failed to park messages: {e}") from e
+        if response.get("Failed"):
+            raise RuntimeError(f"Failed to park messages: {response['Failed']}")
+        return
+
+    with open(PARKED_EVENTS_FILE, "a", encoding="utf-8") as f:
+        for m in messages:
+            f.write(json.dumps({
+                "message_id": m.message_id,
+                "receive_count": m.receive_count,
+                "body": m.raw_body,
+            }) + "\n")
+
+
+def peek(transport):
+    """Print the next message without consuming it (the old one-shot mode)."""
+    if ORDER_EVENT_TRANSPORT == "aws":
+        print("Note: SQS counts a peek as a receive of the message.")
+    messages = transport.peek(1)
+    if not messages:
+        print("No messages available.")
+    for msg in messages:
+        print(f"Message {msg.message_id} (received {msg.receive_count} times):")
+        print(json.dumps(msg.body, indent=4) if msg.body is not None else msg.raw_body)
 
-AWS_REGION = os.environ.get("AWS_REGION", "eu-west-1")
-SQS_QUEUE_URL = os.environ.get("SQS_QUEUE_URL")
 
 def main():
-    if not SQS_QUEUE_URL:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="concurrent batches")
+    parser.add_argument("--visibility-timeout", type=int, default=60,
+                        help="seconds a received message stays hidden")
+    parser.add_argument("--max-receives", type=int, default=5,
+                        help="deliveries before a message is parked")
+    parser.add_argument("--report-interval", type=float, default=60.0,
+                        help="seconds between throughput / lag reports")
+    parser.add_argument("--peek", action="store_true",
+                        help="print one message without consuming it")
+    args = parser.parse_args()
+
+    if ORDER_EVENT_TRANSPORT == "inprocess":
+        print("The inprocess transport is consumed inside the web app; nothing to read.")
+        return
+    if ORDER_EVENT_TRANSPORT == "aws" and not os.environ.get("SQS_QUEUE_URL"):
         print("Missing SQS_QUEUE_URL")
         return
+    transport = create_transport(
+        ORDER_EVENT_TRANSPORT, ORDER_EVENT_QUEUE_PATH, ORDER_EVENT_RETENTION_SECONDS
+    )
 
-    sqs = boto3.client("sqs", region_name=AWS_REGION)
+    if args.peek:
+        peek(transport)
+        return
 
-    response = sqs.receive_message(
-        QueueUrl=SQS_QUEUE_URL,
-        MaxNumberOfMessages=1,
-        WaitTimeSeconds=2
+    db.init_db()
+    consumer = EventConsumer(
+        transport,
+        handle=handle_order_events,
+        park=park_messages,
+        workers=args.workers,
+        visibility_timeout=args.visibility_timeout,
+        max_receives=args.max_receives,
+        report_interval=args.report_interval,
+        # local polls are cheap; short waits make shutdown quick
+        wait_seconds=20 if ORDER_EVENT_TRANSPORT == "aws" else 2,
     )
 
-    messages = response.get("Messages", [])
-    if not messages:
-        print("No messages available.")
-    else:
-        for msg in messages:
-            print("Message:")
-            print(json.dumps(json.loads(msg["Body"]), indent=4))
+    def request_stop(signum, frame):
+        print("Stopping after the current poll...")
+        consumer.stop()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    consumer.run()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,99 @@
+"""
+Start-up time report for the web app.
+
+Imports app.py in fresh interpreters, once plainly to measure wall time and
+once under `python -X importtime` to see where that time goes, and prints
+the slowest top-level packages. Run it before and after a change (or in CI
+with --json) to track cold-start time.
+
+Usage:
+    python startup_report.py
+    python startup_report.py --top 25
+    python startup_report.py --json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WALL_TIME_SNIPPET = (
+    "import time; start = time.perf_counter(); import app; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def run_python(*args):
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Parse `-X importtime` output into {module: (self_us, cumulative_us)}.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def build_report(top: int = 15) -> dict:
+    wall_seconds = float(run_python("-c", WALL_TIME_SNIPPET).stdout.strip().splitlines()[-1])
+    modules = parse_importtime(run_python("-X", "importtime", "-c", "import app").stderr)
+
+    # self time summed per top-level package, so flask.* counts as flask
+    packages = defaultdict(int)
+    for name, (self_us, _) in modules.items():
+        packages[name.split(".")[0]] += self_us
+
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "python": sys.version.split()[0],
+        "wall_ms": round(wall_seconds * 1000, 1),
+        "import_app_ms": round(modules.get("app", (0, 0))[1] / 1000, 1),
+        "modules_imported": len(modules),
+        "aws_sdk_imported": any(
+            name.split(".")[0] in ("boto3", "botocore") for name in modules
+        ),
+        "packages": [
+            {"package": name, "self_ms": round(us / 1000, 1)} for name, us in slowest
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--top", type=int, default=15, help="packages to list")
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    args = parser.parse_args()
+
+    report = build_report(args.top)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Python {report['python']}")
+    print(f"import app (wall):       {report['wall_ms']:8.1f} ms")
+    print(f"import app (importtime): {report['import_app_ms']:8.1f} ms")
+    print(f"modules imported:        {report['modules_imported']:8d}")
+    print(f"boto3/botocore imported: {'yes' if report['aws_sdk_imported'] else 'no':>8}")
+    print()
+    print(f"{'package':<28}{'self ms':>10}")
+    for row in report["packages"]:
+        print(f"{row['package']:<28}{row['self_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+/*
+ * "Add to Cart" without leaving the page.
+ *
+ * Links marked data-add-to-cart="<game id>" are sent to the JSON cart API
+ * and the header count is updated in place. Each click carries an
+ * Idempotency-Key that is kept until the request finishes, so a double
+ * click adds the game once. Without JavaScript, or if the request fails,
+ * the link is followed as before.
+ */
+(function () {
+    "use strict";
+
+    function newKey() {
+        if (window.crypto && window.crypto.randomUUID) {
+            return window.crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    function showCount(count) {
+        document.querySelectorAll("[data-cart-count]").forEach(function (el) {
+            el.textContent = count;
+        });
+    }
+
+    document.addEventListener("click", function (event) {
+        var link = event.target.closest("a[data-add-to-cart]");
+        if (!link || event.button !== 0 || event.metaKey || event.ctrlKey || event.shiftKey) {
+            return;
+        }
+        event.preventDefault();
+
+        if (!link.dataset.idempotencyKey) {
+            link.dataset.idempotencyKey = newKey();
+        }
+
+        fetch("/api/cart/items", {
+            method: "POST",
+            credentials: "same-origin",
+            headers: {
+                "Content-Type": "application/json",
+                "Idempotency-Key": link.dataset.idempotencyKey
+            },
+            body: JSON.stringify({ game_id: Number(link.dataset.addToCart) })
+        })
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error("cart API returned " + response.status);
+                }
+                return response.json();
+            })
+            .then(function (cart) {
+                // the next click is a deliberate second copy
+                delete link.dataset.idempotencyKey;
+                showCount(cart.count);
+                if (!link.dataset.label) {
+                    link.dataset.label = link.textContent;
+                }
+                link.textContent = "Added to cart";
+                setTimeout(function () {
+                    link.textContent = link.dataset.label;
+                }, 1500);
+            })
+            .catch(function () {
+                window.location.href = link.href;
+            });
+    });
+})();
@@ -0,0 +1,45 @@
+"""
+Shared setup for the test suite.
+
+app.py reads its configuration at import time, so the `gamestore` fixture
+sets up the environment (a temporary database, image and spool folders, an
+S3 bucket name, no background dispatchers) before importing the app, once
+per session, and restores the environment afterwards.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def gamestore(tmp_path_factory):
+    """The app module, imported against a throwaway database."""
+    work_dir = tmp_path_factory.mktemp("gamestore")
+    with pytest.MonkeyPatch.context() as mp:
+        for name, value in {
+            "GAMESTORE_DB_PATH": str(work_dir / "game_store.db"),
+            "IMAGE_FOLDER": str(work_dir / "images"),
+            "IMAGE_SPOOL_FOLDER": str(work_dir / "spool"),
+            "JINJA_CACHE_DIR": str(work_dir / "jinja-cache"),
+            "S3_BUCKET_NAME": "test-bucket",
+            "IMAGE_UPLOADS_ASYNC": "1",
+            "IMAGE_UPLOAD_POLL_INTERVAL": "0.1",
+            "OUTBOX_DISPATCHER": "0",
+            "ORDER_EVENT_TRANSPORT": "inprocess",
+            "ORDER_EVENT_CONSUMER": "0",
+            "METRICS": "0",
+        }.items():
+            mp.setenv(name, value)
+        mp.syspath_prepend(ROOT)
+
+        import app
+        app.db.init_db()
+        yield app
+
+
+@pytest.fixture(scope="session")
+def db(gamestore):
+    return gamestore.db
@@ -0,0 +1,191 @@
+"""
+Background S3 image uploads against a local stand-in for S3: the shared
+boto3 client registry is given a stub client (see conftest.py for the
+environment the app is imported with).
+"""
+import io
+import os
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+
+class StubS3:
+    """The S3 calls S3ImageStore makes, kept in memory; fails the first `failures` uploads."""
+
+    def __init__(self, failures=0):
+        self.objects = {}
+        self.failures = failures
+        self.attempts = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None):
+        self.release.wait(10)
+        self.attempts += 1
+        if self.failures:
+            self.failures -= 1
+            raise ClientError({"Error": {"Code": "500", "Message": "boom"}}, "PutObject")
+        with open(Filename, "rb") as f:
+            self.objects[(Bucket, Key)] = (f.read(), ExtraArgs)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.05)
+    raise AssertionError("timed out waiting for the upload pool")
+
+
+@pytest.fixture(scope="module")
+def seller(gamestore):
+    client = gamestore.app.test_client()
+    client.post("/register", data={
+        "email": "seller@example.com", "password": "secret123", "user_type": "seller",
+    })
+    client.post("/login", data={"email": "seller@example.com", "password": "secret123"})
+    return client
+
+
+@pytest.fixture
+def s3(gamestore):
+    # gamestore_lib reads the AWS settings at import, so only after the app
+    from gamestore_lib import clients
+    from gamestore_lib.aws_clients import AWS_REGION
+
+    stub = StubS3()
+    clients.set("s3", stub, AWS_REGION)
+    yield stub
+    stub.release.set()
+
+
+def add_game(db, client, title, data):
+    response = client.post(
+        "/seller/add-game",
+        data={"title": title, "price": "9.99", "description": "",
+              "image_file": (io.BytesIO(data), "cover.png")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 302
+    conn = db.connect()
+    try:
+        return conn.execute("SELECT id FROM games WHERE title = ?", (title,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def upload_row(db, game_id):
+    conn = db.connect()
+    try:
+        return conn.execute(
+            "SELECT image_key, status, attempts, last_error FROM image_uploads WHERE game_id = ?",
+            (game_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def image_url(db, game_id):
+    conn = db.connect()
+    try:
+        return conn.execute("SELECT image_url FROM games WHERE id = ?", (game_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def make_due(gamestore, game_id):
+    gamestore.db.run_write(lambda conn: conn.execute(
+        "UPDATE image_uploads SET next_attempt_at = 0 WHERE game_id = ?", (game_id,)
+    ))
+    gamestore.get_image_upload_pool().notify()
+
+
+def test_spooled_upload_is_pending(gamestore, db, seller, s3):
+    # hold the upload so the row can be seen before it finishes
+    s3.release.clear()
+    game_id = add_game(db, seller, "Pending Cover", os.urandom(2048))
+
+    row = upload_row(db, game_id)
+    assert row["status"] == "pending"
+    assert image_url(db, game_id) is None
+    assert os.path.exists(gamestore.image_spool.path_for(row["image_key"]))
+
+    s3.release.set()
+    wait_for(lambda: upload_row(db, game_id) is None)
+
+
+def test_failed_upload_is_rescheduled(gamestore, db, seller, s3):
+    s3.failures = 1
+    game_id = add_game(db, seller, "Flaky Cover", os.urandom(2048))
+
+    def attempted_once():
+        row = upload_row(db, game_id)
+        return row if row is not None and row["attempts"] == 1 else None
+
+    row = wait_for(attempted_once)
+    assert row["status"] == "pending"
+    assert "boom" in row["last_error"]
+    assert image_url(db, game_id) is None
+
+    make_due(gamestore, game_id)
+    wait_for(lambda: upload_row(db, game_id) is None)
+    assert s3.attempts == 2
+
+
+def test_success_points_game_at_s3_and_removes_spool(gamestore, db, seller, s3):
+    data = os.urandom(4096)
+    s3.release.clear()
+    game_id = add_game(db, seller, "Finished Cover", data)
+    key = upload_row(db, game_id)["image_key"]
+    spool_path = gamestore.image_spool.path_for(key)
+    s3.release.set()
+
+    # the spool file is removed just after the upload row
+    wait_for(lambda: upload_row(db, game_id) is None and not os.path.exists(spool_path))
+
+    assert image_url(db, game_id) == gamestore.image_store.url_for(key)
+    assert image_url(db, game_id).startswith("https://test-bucket.s3.")
+    stored, extra_args = s3.objects[("test-bucket", "game-images/" + key)]
+    assert stored == data
+    assert extra_args["CacheControl"] == gamestore.IMAGE_CACHE_CONTROL
+
+
+def test_replaced_pending_image_removes_old_spool(gamestore, db, seller, s3):
+    s3.release.clear()
+    game_id = add_game(db, seller, "Replaced Cover", os.urandom(2048))
+    old_spool = gamestore.image_spool.path_for(upload_row(db, game_id)["image_key"])
+
+    response = seller.post(
+        f"/seller/edit-game/{game_id}",
+        data={"title": "Replaced Cover", "price": "9.99", "description": "",
+              "image_file": (io.BytesIO(os.urandom(2048)), "cover.png")},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 302
+    new_spool = gamestore.image_spool.path_for(upload_row(db, game_id)["image_key"])
+    assert not os.path.exists(old_spool)
+    assert os.path.exists(new_spool)
+
+    s3.release.set()
+    wait_for(lambda: upload_row(db, game_id) is None and not os.path.exists(new_spool))
+
+
+def test_deleted_game_removes_pending_spool(gamestore, db, seller, s3):
+    s3.release.clear()
+    game_id = add_game(db, seller, "Deleted Cover", os.urandom(2048))
+    spool_path = gamestore.image_spool.path_for(upload_row(db, game_id)["image_key"])
+
+    response = seller.post(f"/seller/delete-game/{game_id}")
+    assert response.status_code == 302
+    assert upload_row(db, game_id) is None
+    assert not os.path.exists(spool_path)
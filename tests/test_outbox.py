@@ -0,0 +1,47 @@
+"""Outbox retention: delivered events are purged by the dispatcher."""
+import threading
+
+
+def add_event(db, status, delivered_at=None):
+    def insert(conn):
+        return conn.execute(
+            "INSERT INTO outbox (destination, payload, status, delivered_at) VALUES ('sqs', '{}', ?, ?)",
+            (status, delivered_at),
+        ).lastrowid
+    return db.run_write(insert)
+
+
+def outbox_ids(db):
+    conn = db.connect()
+    try:
+        return {row[0] for row in conn.execute("SELECT id FROM outbox")}
+    finally:
+        conn.close()
+
+
+def test_purge_keeps_pending_and_recent_events(db):
+    old = add_event(db, "delivered", "2000-01-01 00:00:00")
+    recent = add_event(db, "delivered", "9999-01-01 00:00:00")
+    pending = add_event(db, "pending")
+
+    assert db.run_write(db.purge_delivered_outbox, 24 * 60 * 60) == 1
+    ids = outbox_ids(db)
+    assert old not in ids
+    assert {recent, pending} <= ids
+
+
+def test_dispatcher_purges_on_its_interval(gamestore):
+    purged = threading.Event()
+
+    def purge():
+        purged.set()
+        return 0
+
+    dispatcher = gamestore.OutboxDispatcher(
+        claim=lambda limit: [], complete=None, fail=None, purge=purge,
+        poll_interval=0.05, transport=gamestore.order_transport,
+    )
+    try:
+        assert purged.wait(5)
+    finally:
+        dispatcher.stop()
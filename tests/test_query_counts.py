@@ -0,0 +1,70 @@
+"""Statement budgets per route (see `flask check-query-counts`) and the N+1 detector."""
+import pytest
+
+
+@pytest.fixture
+def tracer(db, monkeypatch):
+    """Route db's hooks to a tracer for one test; returns a function that attaches one."""
+    def attach(tracer):
+        monkeypatch.setattr(db, "connection_hooks", [tracer.attach])
+        monkeypatch.setattr(db, "query_listeners", [tracer.on_query])
+        monkeypatch.setattr(db, "row_listeners", [tracer.on_rows])
+        return tracer
+    return attach
+
+
+@pytest.fixture(scope="module")
+def game_id(db):
+    seller_id = db.run_write(db.insert_user, "budget-seller@example.com", "x", "seller")
+    return db.run_write(db.insert_game, "Budget Game", "", 9.99, None, seller_id)
+
+
+def test_routes_stay_within_query_budgets(gamestore, tracer, game_id, subtests):
+    sql_tracer = tracer(gamestore.sql_tracer)
+    for route, budget in gamestore.ROUTE_QUERY_BUDGETS.items():
+        path = route.format(game_id=game_id)
+        with subtests.test(msg=path):
+            # a fresh client (no cookies) and cold page caches for each route
+            gamestore.response_cache.clear()
+            with gamestore.assert_max_queries(sql_tracer, budget, f"GET {path}") as trace:
+                response = gamestore.app.test_client().get(path)
+            assert response.status_code == 200
+
+
+
+def test_request_trace_is_closed_at_teardown(gamestore, tracer, monkeypatch):
+    sql_tracer = tracer(gamestore.sql_tracer)
+    monkeypatch.setattr(gamestore, "SQL_TRACE_ENABLED", True)
+    with sql_tracer.trace("outer") as outer:
+        response = gamestore.app.test_client().get("/")
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    assert outer.count > 0
+    # a request trace left open would have been closed in place of `outer`
+    assert sql_tracer.finish() is None
+
+def test_repeated_statement_is_reported(gamestore, db, tracer):
+    logs = []
+    sql_tracer = tracer(gamestore.SQLTracer(repeat_threshold=3, log=logs.append))
+    conn = db.connect()
+    try:
+        with sql_tracer.trace("loop") as trace:
+            for game_id in range(5):
+                conn.execute("SELECT title FROM games WHERE id = ?", (game_id,)).fetchone()
+            conn.execute("SELECT COUNT(*) FROM games").fetchone()
+    finally:
+        conn.close()
+
+    assert trace.repeated(3) == [("SELECT title FROM games WHERE id = ?", 5)]
+    assert logs == ["Possible N+1 in loop: 5 x SELECT title FROM games WHERE id = ?"]
+
+
+def test_assert_max_queries_fails_over_budget(gamestore, db, tracer):
+    sql_tracer = tracer(gamestore.SQLTracer())
+    conn = db.connect()
+    try:
+        with pytest.raises(AssertionError, match="ran 2 queries, expected at most 1"):
+            with gamestore.assert_max_queries(sql_tracer, 1, "two queries"):
+                conn.execute("SELECT 1").fetchone()
+                conn.execute("SELECT 2").fetchone()
+    finally:
+        conn.close()
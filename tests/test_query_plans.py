@@ -0,0 +1,11 @@
+"""Every hot query the views run must be served by an index (see `flask check-query-plans`)."""
+
+
+def test_hot_queries_use_indexes(gamestore, db, subtests):
+    conn = db.connect()
+    try:
+        for name, query, params, options in gamestore.query_plan_checks():
+            with subtests.test(msg=name):
+                assert db.find_plan_problems(conn, query, params, **options) == []
+    finally:
+        conn.close()
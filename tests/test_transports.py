@@ -0,0 +1,39 @@
+"""The local SQLite order event queue."""
+import pytest
+
+
+@pytest.fixture
+def queue(gamestore, tmp_path):
+    # imported through the app: gamestore_lib reads its settings at import
+    from gamestore_lib.transports import SQLiteQueueTransport
+
+    return SQLiteQueueTransport(str(tmp_path / "order_events.db"), poll_interval=0.05)
+
+
+def test_acknowledged_messages_are_deleted(queue):
+    queue.send_events([("1", '{"order_id": 1}'), ("2", '{"order_id": 2}')])
+    messages = queue.receive(10, 0, 30)
+    assert [m.body["order_id"] for m in messages] == [1, 2]
+
+    queue.delete(messages)
+    assert queue.conn.execute("SELECT COUNT(*) FROM queue_messages").fetchone()[0] == 0
+
+
+def test_messages_past_retention_are_purged(queue):
+    queue.send_events([("1", '{"order_id": 1}')])
+    queue.conn.execute("UPDATE queue_messages SET sent_at = sent_at - ?", (queue.retention_seconds + 1,))
+    queue.send_events([("2", '{"order_id": 2}')])
+
+    assert queue.purge() == 1
+    assert [m.body["order_id"] for m in queue.receive(10, 0, 30)] == [2]
+
+
+def test_peek_does_not_receive(queue):
+    queue.send_events([("1", '{"order_id": 1}')])
+    for _ in range(3):
+        [peeked] = queue.peek(10)
+        assert peeked.body == {"order_id": 1} and peeked.receive_count == 0
+
+    [received] = queue.receive(10, 0, 30)
+    assert received.receive_count == 1
+    assert queue.peek(10) == []